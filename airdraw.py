@@ -1,7 +1,15 @@
+import argparse
+import time
 import numpy as np
 import cv2 as cv
 from hands import HandDetector
 from canvas import Canvas
+from eventlog import GestureLog, read_gesture_log
+from export import export_png
+from pipeline import Pipeline
+from server import CanvasServer
+from store import SessionStore
+from timing import HUD, NULL_TIMER, StageTimer
 
 
 def replay(fname):
@@ -39,7 +47,123 @@ def replay(fname):
 
     print("replay complete", fname)
 
-def main():
+def replay_headless(fname, output=None, fps=None, detector_options=None, timer=None, gesture_log=None, server=None):
+    """
+    Runs a recording through the detector and canvas as fast as possible, no window and no key presses.
+
+    Frames get timestamps from a virtual clock running at fps (the video's own rate if None), so smoothing
+    that depends on time does exactly the same thing on every run no matter how fast the machine is
+    (detect_every='auto' still picks its rate from measured inference time, use a fixed N for repeatable runs).
+    If output is given the annotated frames are written there as a video.
+    Returns the report printed at the end: throughput and per frame latency percentiles.
+    With a timing.StageTimer the report also gets its per stage stats under 'stages'.
+    gesture_log is a path to log every frame's hands metadata to (see eventlog.py).
+    server is a CanvasServer (not started yet) to stream the canvas to while it replays.
+    """
+    cap = cv.VideoCapture(fname)
+    if not cap.isOpened():
+        raise IOError(f"can't open {fname}")
+    width = int(cap.get(cv.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv.CAP_PROP_FRAME_HEIGHT))
+    fps = fps or cap.get(cv.CAP_PROP_FPS) or 30.0
+
+    timer = timer if timer is not None else NULL_TIMER
+    canvas = Canvas(height, width, timer=timer)
+    detector = HandDetector(**(detector_options or {}), timer=timer)
+    writer = None
+    if output is not None:
+        writer = cv.VideoWriter(output, cv.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    log = GestureLog(gesture_log, (height, width, 3)) if gesture_log is not None else None
+    if server is not None:
+        server.attach(canvas)
+        server.start()
+
+    latencies = [] # seconds from decoded frame to finished annotated frame
+    start = time.perf_counter()
+    frame_index = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frame_start = time.perf_counter()
+        hands_metadata = detector.get_hands_metadata(frame, frame_index / fps)
+        if log is not None:
+            log.write(hands_metadata)
+        frame = canvas.update_and_draw(frame, hands_metadata)
+        if server is not None:
+            server.sync(canvas)
+        landmarks_start = timer.start()
+        detector.draw_landmarks(frame)
+        timer.stop('landmarks', landmarks_start)
+        latencies.append(time.perf_counter() - frame_start)
+        if writer is not None:
+            writer.write(frame)
+        frame_index += 1
+    elapsed = time.perf_counter() - start
+
+    cap.release()
+    if writer is not None:
+        writer.release()
+    if log is not None:
+        log.close()
+    if server is not None:
+        server.stop()
+
+    report = {'frames': frame_index, 'seconds': elapsed, 'fps': frame_index / elapsed if elapsed > 0 else 0.0}
+    if latencies:
+        percentiles = np.percentile(np.array(latencies) * 1000, [50, 90, 99, 100])
+        report.update(zip(['p50_ms', 'p90_ms', 'p99_ms', 'max_ms'], percentiles.tolist()))
+    print(f"{fname}: {report['frames']} frames in {elapsed:.2f}s, {report['fps']:.1f} fps")
+    if latencies:
+        print("per frame latency (ms): " + ", ".join(f"{name[:-3]} {report[name]:.2f}" for name in ('p50_ms', 'p90_ms', 'p99_ms', 'max_ms')))
+    if timer.enabled:
+        report['stages'] = timer.stats()
+        print_stages(report['stages'])
+    return report
+
+def replay_gestures(fname, output=None):
+    """
+    Rebuilds the canvas a gesture log (see eventlog.py) ends with, no video or hand detection involved.
+    If output is given the result gets exported there as a PNG. Returns the canvas.
+    """
+    frame_shape, events = read_gesture_log(fname)
+    canvas = Canvas(frame_shape[0], frame_shape[1])
+    start = time.perf_counter()
+    canvas.replay_events(frame_shape, events)
+    canvas.end_all_drawing()
+    elapsed = time.perf_counter() - start
+    frames = int(events['frame'][-1]) + 1 if len(events) else 0
+    print(f"{fname}: {frames} frames replayed in {elapsed:.3f}s, {len(canvas.lines)} lines, {len(canvas.circles)} circles, {len(canvas.squares)} squares")
+    if output is not None:
+        export_png(canvas, output)
+    return canvas
+
+def print_stages(stages):
+    for stage, row in stages.items():
+        print(f"{stage:<14} p50 {row['p50_ms']:7.2f}  p99 {row['p99_ms']:7.2f}  max {row['max_ms']:7.2f} ms  ({row['count']} samples)")
+
+def handle_key(stroke, canvas, store):
+    """Reacts to a key press, returns True if it's time to quit"""
+    if stroke == ord('b'): # press 'b' to switch backgrounds (camera/black)
+        canvas.switch_background()
+    if stroke == ord('z'): # press 'z' to undo the last gesture
+        canvas.undo()
+    if stroke == ord('y'): # press 'y' to redo it
+        canvas.redo()
+    if stroke == ord('s') and store is not None: # press 's' to write a snapshot now
+        store.save_snapshot(canvas)
+
+    return stroke == ord('q') or stroke == 27 # press 'q' or 'esc' to quit
+
+def main(session_dir=None, detector_options=None, pipelined=False, timer=None, hud=False, stats_path=None, gesture_log=None,
+         server=None):
+    """
+    The live loop. With a timing.StageTimer every stage of every frame gets timed, hud draws the numbers
+    onto the frame (needs the timer) and stats_path is where they get exported to on exit (.json or .csv).
+    gesture_log is a path to log every frame's hands metadata to, replay it with replay_gestures.
+    server is a CanvasServer (not started yet) to stream the canvas to browsers with.
+    """
+    timer = timer if timer is not None else NULL_TIMER
     # Loading the default webcam of PC.
     cap = cv.VideoCapture(0)
     
@@ -48,32 +172,151 @@ def main():
     height = int(cap.get(cv.CAP_PROP_FRAME_HEIGHT) + 0.5)
 
     # initialize the canvas element and hand-detector program
-    canvas = Canvas(height, width)
-    detector = HandDetector()
+    canvas = Canvas(height, width, timer=timer)
+    detector = HandDetector(**(detector_options or {}), timer=timer)
+    hud = HUD(timer) if hud and timer.enabled else None
+    log = GestureLog(gesture_log, (height, width, 3)) if gesture_log is not None else None
     print(width, height)
-    
-    # Keep looping
-    while True:
-        # Reading the frame from the camera
-        ret, frame = cap.read()
-        frame = cv.flip(frame, 1)
 
-        gesture_metadata = detector.get_gesture_metadata(frame)
+    # pick up where the last session left off, and keep logging changes to disk as we go
+    store = None
+    if session_dir is not None:
+        store = SessionStore(session_dir)
+        store.load(canvas)
+        store.attach(canvas)
+    if server is not None:
+        server.attach(canvas)
+        server.start()
+        print(f"streaming the canvas on http://{server.host}:{server.port}/")
 
-        frame = canvas.update_and_draw(frame, gesture_metadata)
-        detector.draw_landmarks(frame)
-       
-        cv.imshow("Airdraw", frame)
-    
-        stroke = cv.waitKey(1) & 0xff  
-        if stroke == ord('b'): # press 'b' to switch backgrounds (camera/black)
-            canvas.switch_background()
-        
-        if stroke == ord('q') or stroke == 27: # press 'q' or 'esc' to quit
-            break
+    if pipelined:
+        run_pipelined(cap, detector, canvas, store, timer, hud, log, server)
+    else:
+        # Keep looping
+        while True:
+            frame_start = timer.start()
+            # Reading the frame from the camera
+            ret, frame = cap.read()
+            timer.stop('capture', frame_start)
+            start = timer.start()
+            frame = cv.flip(frame, 1)
+            timer.stop('flip', start)
+
+            start = timer.start()
+            hands_metadata = detector.get_hands_metadata(frame)
+            timer.stop('hands', start)
+            if log is not None:
+                log.write(hands_metadata)
+
+            frame = canvas.update_and_draw(frame, hands_metadata)
+            if server is not None:
+                server.sync(canvas)
+            start = timer.start()
+            detector.draw_landmarks(frame)
+            timer.stop('landmarks', start)
+            if hud is not None:
+                hud.draw(frame, canvas)
+
+            start = timer.start()
+            cv.imshow("Airdraw", frame)
+            stroke = cv.waitKey(1) & 0xff
+            timer.stop('imshow', start)
+            timer.stop('frame', frame_start)
+
+            if handle_key(stroke, canvas, store):
+                break
+
+    if timer.enabled:
+        print_stages(timer.stats())
+        if stats_path is not None:
+            timer.export(stats_path)
     
+    if log is not None:
+        log.close()
+    if store is not None:
+        store.close(canvas)
+    if server is not None:
+        server.stop()
     cap.release()
     cv.destroyAllWindows()
 
+def run_pipelined(cap, detector, canvas, store, timer=NULL_TIMER, hud=None, log=None, server=None):
+    """
+    Same loop as main, but capture and inference run on their own threads (see pipeline.py),
+    this thread only updates the canvas and shows frames. Prints how many frames each stage dropped at the end.
+    'frame' is timed per rendered frame here, so it's the render loop's rate, not the camera's.
+    """
+    pipeline = Pipeline(cap, detector, timer=timer)
+    pipeline.start()
+    try:
+        while not pipeline.finished:
+            result = pipeline.next_result()
+            if result is not None:
+                frame_start = timer.start()
+                frame, timestamp, hands_metadata, landmarks = result
+                if log is not None:
+                    log.write(hands_metadata)
+                frame = canvas.update_and_draw(frame, hands_metadata)
+                if server is not None:
+                    server.sync(canvas)
+                start = timer.start()
+                detector.draw_landmarks(frame, landmarks)
+                timer.stop('landmarks', start)
+                if hud is not None:
+                    hud.draw(frame, canvas)
+                start = timer.start()
+                cv.imshow("Airdraw", frame)
+                timer.stop('imshow', start)
+                pipeline.rendered_frame(timestamp)
+                timer.stop('frame', frame_start)
+
+            if handle_key(cv.waitKey(1) & 0xff, canvas, store):
+                break
+    finally:
+        pipeline.stop()
+    for stage, value in pipeline.stats().items():
+        print(f"{stage}: {value:.1f}" if isinstance(value, float) else f"{stage}: {value}")
+
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(
+        prog='airdraw.py',
+        description='draw in the air with your hands'
+    )
+    parser.add_argument("-s", "--session", help="directory to restore the canvas from and save it to")
+    parser.add_argument("--replay", metavar="VIDEO", help="run a recording headless as fast as possible instead of the camera, and report fps")
+    parser.add_argument("--output", metavar="FILE", help="with --replay: write the annotated frames to this video, "
+                        "with --replay-gestures: export the final canvas to this PNG")
+    parser.add_argument("--log-gestures", metavar="LOG", help="log every frame's gestures to LOG, to rebuild the canvas later with --replay-gestures")
+    parser.add_argument("--replay-gestures", metavar="LOG", help="rebuild the canvas from a gesture log, no camera or hand detection")
+    parser.add_argument("--serve", metavar="PORT", type=int, nargs="?", const=8765,
+                        help="stream the canvas to browsers, open http://HOST:PORT/ to watch (default port 8765)")
+    parser.add_argument("--host", default="127.0.0.1", help="with --serve: address to listen on, 0.0.0.0 to let other machines watch")
+    parser.add_argument("--fps", type=float, help="with --replay: virtual frame rate the frames are timestamped at (default: the video's)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="run capture, hand detection and drawing on separate threads so each runs as fast as it can")
+    parser.add_argument("--hands", type=int, default=1, help="how many hands can draw at the same time")
+    parser.add_argument("--track-roi", action="store_true", help="only run hand detection around where the hand was last frame")
+    parser.add_argument("--inference-size", type=int, help="downscale images sent to hand detection to at most this many pixels on a side")
+    parser.add_argument("--detect-every", default="1",
+                        help="run hand detection every N frames and predict the hand in between, or 'auto' to pick N from inference time")
+    parser.add_argument("--smoothing", choices=['average', 'one_euro'], default='average',
+                        help="landmark smoothing, one_euro lags behind the finger a lot less")
+    parser.add_argument("--min-cutoff", type=float, default=1.0, help="one_euro: lower means less jitter when still")
+    parser.add_argument("--beta", type=float, default=0.01, help="one_euro: higher means less lag when moving")
+    parser.add_argument("--profile", action="store_true", help="time every stage of every frame and print p50/p99 per stage at the end")
+    parser.add_argument("--hud", action="store_true", help="show fps, per stage latencies and stroke counts on screen (implies --profile)")
+    parser.add_argument("--stats", metavar="PATH", help="export the per stage latencies to PATH (.json or .csv) on exit (implies --profile)")
+    args = parser.parse_args()
+    detect_every = args.detect_every if args.detect_every == 'auto' else int(args.detect_every)
+    detector_options = {'max_hands': args.hands, 'track_roi': args.track_roi, 'inference_size': args.inference_size, 'detect_every': detect_every,
+                        'smoothing': args.smoothing, 'one_euro_options': {'min_cutoff': args.min_cutoff, 'beta': args.beta}}
+    timer = StageTimer() if args.profile or args.hud or args.stats else None
+    server = CanvasServer(args.host, args.serve) if args.serve is not None else None
+    if args.replay_gestures is not None:
+        replay_gestures(args.replay_gestures, args.output)
+    elif args.replay is not None:
+        replay_headless(args.replay, args.output, args.fps, detector_options, timer, args.log_gestures, server)
+        if args.stats is not None:
+            timer.export(args.stats)
+    else:
+        main(args.session, detector_options, args.pipeline, timer, args.hud, args.stats, args.log_gestures, server)
@@ -0,0 +1,254 @@
+import argparse
+import hashlib
+import inspect
+import json
+import multiprocessing
+import os
+import shutil
+import time
+
+import cv2 as cv
+import numpy as np
+
+from canvas import Canvas
+from export import export_png
+from hands import HandDetector
+
+# handedness labels as stored in traces, index 0 = unknown
+HANDEDNESS = [None, 'Left', 'Right']
+
+
+class LandmarkTrace():
+    """
+    Raw (unsmoothed) landmarks of every frame of a video, what HandDetector.detect_hands returned for each.
+
+    landmarks: (frames, max_hands, 21, 3) int16 of (idx, x, y) in pixels
+    counts: (frames,) uint8 number of hands found in each frame
+    handedness: (frames, max_hands) int8 indices into HANDEDNESS
+    """
+
+    def __init__(self, landmarks, counts, handedness, width, height, fps):
+        self.landmarks = landmarks
+        self.counts = counts
+        self.handedness = handedness
+        self.width = width
+        self.height = height
+        self.fps = fps
+
+    def __len__(self):
+        return len(self.counts)
+
+    def hands(self, frame):
+        """The hands of one frame in the format detect_hands returns, ready for hands_metadata_from_landmarks"""
+        count = int(self.counts[frame])
+        return [(self.landmarks[frame, i].astype(np.float64), HANDEDNESS[self.handedness[frame, i]]) for i in range(count)]
+
+
+class TraceCache():
+    """
+    LandmarkTraces on disk, so replaying a video a second time skips decoding and inference entirely.
+
+    Each trace lives in its own directory named after a hash of the video's bytes and of every detector setting
+    that changes what gets detected, holding the trace arrays as .npy files (memory mapped when loaded)
+    and the video size/fps in meta.json.
+    """
+
+    VERSION = 1 # bump whenever the format or what goes into the key changes
+    ARRAYS = ('landmarks', 'counts', 'handedness')
+    # detector settings that change the raw landmarks, smoothing and frame skipping only happen after
+    DETECTOR_SETTINGS = ('mode', 'max_hands', 'track_roi', 'roi_margin', 'inference_size')
+
+    def __init__(self, directory='.landmark_cache'):
+        self.directory = directory
+
+    @staticmethod
+    def file_digest(path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def key(self, path, detector_options=None):
+        """Cache key of a video processed with a detector made from detector_options"""
+        detector_options = detector_options if detector_options is not None else {}
+        defaults = inspect.signature(HandDetector.__init__).parameters
+        settings = {name: detector_options.get(name, defaults[name].default) for name in self.DETECTOR_SETTINGS}
+        description = json.dumps({'version': self.VERSION, 'video': self.file_digest(path), 'detector': settings}, sort_keys=True)
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def load(self, key):
+        """The cached trace for key with its arrays memory mapped, None if there isn't one"""
+        directory = os.path.join(self.directory, key)
+        if not os.path.exists(os.path.join(directory, 'meta.json')):
+            return None
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = [np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in self.ARRAYS]
+        return LandmarkTrace(*arrays, meta['width'], meta['height'], meta['fps'])
+
+    def save(self, key, trace):
+        """Stores a trace, written to a temporary directory first so a crash never leaves half a trace behind"""
+        directory = os.path.join(self.directory, key)
+        tmp_directory = f'{directory}.{os.getpid()}.tmp'
+        os.makedirs(tmp_directory, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(tmp_directory, f'{name}.npy'), getattr(trace, name))
+        # meta.json goes last, it's what load() checks for
+        with open(os.path.join(tmp_directory, 'meta.json'), 'w') as f:
+            json.dump({'width': trace.width, 'height': trace.height, 'fps': trace.fps}, f)
+        try:
+            os.rename(tmp_directory, directory)
+        except OSError:
+            # someone else cached it first
+            shutil.rmtree(tmp_directory, ignore_errors=True)
+
+
+def video_info(path):
+    """(frame count, width, height, fps) of a video"""
+    cap = cv.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"can't open {path}")
+    info = (int(cap.get(cv.CAP_PROP_FRAME_COUNT)), int(cap.get(cv.CAP_PROP_FRAME_WIDTH)),
+            int(cap.get(cv.CAP_PROP_FRAME_HEIGHT)), cap.get(cv.CAP_PROP_FPS) or 30.0)
+    cap.release()
+    return info
+
+
+# every pool worker builds its own detector once, and resets it before each job
+worker_detector = None
+
+def init_worker(detector_options):
+    global worker_detector
+    worker_detector = HandDetector(**detector_options)
+
+def detect_range(job):
+    """
+    Worker side: runs detection on frames [start, stop) of a video.
+    Returns (landmarks, counts, handedness) arrays for the frames actually read (the video may end early).
+    """
+    path, start, stop = job
+    detector = worker_detector
+    # which worker gets which chunk is up to the pool, nothing from its last chunk (maybe of another video) may leak in
+    detector.reset()
+    max_hands = detector.max_hands
+    landmarks = np.zeros((stop - start, max_hands, 21, 3), dtype=np.int16)
+    counts = np.zeros(stop - start, dtype=np.uint8)
+    handedness = np.zeros((stop - start, max_hands), dtype=np.int8)
+
+    cap = cv.VideoCapture(path)
+    cap.set(cv.CAP_PROP_POS_FRAMES, start)
+    read = 0
+    while read < stop - start:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        hands = detector.detect_hands(frame)
+        counts[read] = len(hands)
+        for i, (hand, label) in enumerate(hands):
+            landmarks[read, i] = hand
+            handedness[read, i] = HANDEDNESS.index(label) if label in HANDEDNESS else 0
+        read += 1
+    cap.release()
+    return landmarks[:read], counts[:read], handedness[:read]
+
+
+def trace_videos(paths, detector_options=None, workers=None, chunk_frames=256, cache=None):
+    """
+    Runs hand detection over every frame of every video on a process pool and returns a LandmarkTrace per video.
+    With a TraceCache, videos already in it are loaded from disk and the rest get added to it.
+
+    Videos are cut into chunks of chunk_frames frames, each chunk is an independent job, and results come back
+    in submission order, so the traces are reassembled in frame order no matter which worker finished first.
+    Mediapipe tracks hands across consecutive frames, so the first frame of a chunk is a cold start,
+    bigger chunks mean fewer of those.
+    """
+    detector_options = detector_options if detector_options is not None else {}
+    traces = [None] * len(paths)
+    keys = [None] * len(paths)
+    if cache is not None:
+        for video, path in enumerate(paths):
+            keys[video] = cache.key(path, detector_options)
+            traces[video] = cache.load(keys[video])
+    missing = [video for video, trace in enumerate(traces) if trace is None]
+    if not missing:
+        return traces
+
+    infos = {video: video_info(paths[video]) for video in missing}
+    jobs = []
+    owners = [] # which video each job belongs to
+    for video in missing:
+        path, frame_count = paths[video], infos[video][0]
+        for start in range(0, max(frame_count, 1), chunk_frames):
+            jobs.append((path, start, start + chunk_frames))
+            owners.append(video)
+
+    chunks = {video: [] for video in missing}
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(detector_options,)) as pool:
+        for video, result in zip(owners, pool.imap(detect_range, jobs)):
+            chunks[video].append(result)
+
+    for video in missing:
+        parts = chunks[video]
+        _, width, height, fps = infos[video]
+        traces[video] = LandmarkTrace(
+            np.concatenate([part[0] for part in parts]),
+            np.concatenate([part[1] for part in parts]),
+            np.concatenate([part[2] for part in parts]),
+            width, height, fps,
+        )
+        if cache is not None:
+            cache.save(keys[video], traces[video])
+    return traces
+
+
+def replay_trace(trace, detector_options=None, canvas=None):
+    """
+    The sequential half: feeds a trace frame by frame through smoothing, gestures and a Canvas (made to fit if None).
+    Frames are timestamped from the video's fps so time based smoothers behave like they would live.
+    """
+    detector = HandDetector(**(detector_options or {})) # never runs Mediapipe here
+    if canvas is None:
+        canvas = Canvas(trace.height, trace.width)
+    frame_shape = (trace.height, trace.width, 3)
+    for frame in range(len(trace)):
+        hands_metadata = detector.hands_metadata_from_landmarks(trace.hands(frame), frame / trace.fps)
+        canvas.update_state(frame_shape, hands_metadata)
+    canvas.end_all_drawing()
+    return canvas
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='batch.py',
+        description='run hand detection over recorded videos on every core, then replay them onto canvases'
+    )
+    parser.add_argument("videos", nargs='+', help="videos recorded with data.py")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--chunk", type=int, default=256, help="frames per job")
+    parser.add_argument("--hands", type=int, default=1, help="max hands to detect")
+    parser.add_argument("-o", "--output", help="directory to export each replayed canvas to as a PNG")
+    parser.add_argument("--cache", default=".landmark_cache", help="where detected landmarks get cached")
+    parser.add_argument("--no-cache", action="store_true", help="always run detection, don't read or write the cache")
+    args = parser.parse_args()
+
+    cache = None if args.no_cache else TraceCache(args.cache)
+    start = time.perf_counter()
+    traces = trace_videos(args.videos, {'max_hands': args.hands}, args.workers, args.chunk, cache)
+    detected = time.perf_counter()
+    frames = sum(len(trace) for trace in traces)
+    print(f"detection: {frames} frames in {detected - start:.1f}s ({frames / max(detected - start, 1e-9):.1f} fps)")
+
+    if args.output is not None:
+        os.makedirs(args.output, exist_ok=True)
+    for path, trace in zip(args.videos, traces):
+        canvas = replay_trace(trace, {'max_hands': args.hands})
+        print(path, len(trace), "frames,", len(canvas.lines), "lines,", len(canvas.circles), "circles,", len(canvas.squares), "squares")
+        if args.output is not None:
+            name = os.path.splitext(os.path.basename(path))[0]
+            export_png(canvas, os.path.join(args.output, f"{name}.png"))
+    print(f"replay: {time.perf_counter() - detected:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
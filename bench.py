@@ -0,0 +1,285 @@
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+
+import cv2 as cv
+import numpy as np
+
+from canvas import Canvas, Line
+from hands import Gesture, HandDetector, LandmarkBuffer, OneEuroFilter
+
+# Benchmarks for the frame loop hot paths. Everything runs on generated landmarks and shapes,
+# no camera and no Mediapipe needed.
+#
+#   python bench.py                      run everything, write bench_results.json
+#   python bench.py --quick -k erase     fewer repeats, only benchmarks with "erase" in the name
+#   python bench.py --compare old.json   also print how each benchmark moved against an earlier run
+
+ROWS, COLUMNS = 1080, 1920
+FRAME_SHAPE = (ROWS, COLUMNS, 3)
+# (points in lines, circles + squares) canvases get filled with
+SCALES = [(1_000, 10), (10_000, 100), (100_000, 1_000)]
+STROKE_POINTS = 100
+
+
+# which fingers are straight for each gesture: index, middle, ring, pinky
+EXTENDED = {
+    Gesture.HOVER: (True, False, False, False),
+    Gesture.DRAW: (True, True, False, False),
+    Gesture.ERASE: (True, True, True, False),
+    Gesture.TRANSLATE: (True, False, False, True),
+}
+
+def synthetic_hand(gesture, center, size=80, rng=None):
+    """
+    (21, 3) (idx, x, y) landmarks of an upright hand centered on (x, y) center making gesture.
+    Straight fingers point up from their knuckle, tucked ones fold back down, which is all detect_gesture looks at.
+    """
+    landmarks = np.zeros((21, 3), dtype=np.float64)
+    landmarks[:, 0] = np.arange(21)
+    x, y = center
+    up = np.array([0.0, -1.0])
+    wrist = np.array([x, y + size * 0.5])
+    landmarks[0, 1:] = wrist
+    for finger in range(5):
+        # thumb is landmarks 1-4, then 4 per finger: knuckle, two joints, tip
+        knuckle = wrist + up * size * 0.6 + np.array([(finger - 2) * size * 0.2, 0.0])
+        direction = up
+        if finger > 0 and not EXTENDED[gesture][finger - 1]:
+            direction = -up
+        base = 1 + 4 * finger
+        landmarks[base, 1:] = knuckle
+        landmarks[base + 1, 1:] = knuckle + up * size * 0.15
+        landmarks[base + 2, 1:] = landmarks[base + 1, 1:] + direction * size * 0.15
+        landmarks[base + 3, 1:] = landmarks[base + 1, 1:] + direction * size * 0.3
+    if rng is not None:
+        landmarks[:, 1:] += rng.normal(0, 0.5, (21, 2))
+    return landmarks
+
+def gesture_stream(frames, rng):
+    """
+    Landmarks a hand would produce over frames frames: strokes drawn along random walks with hovers in between,
+    and every so often an erase or a translate.
+    """
+    stream = []
+    position = np.array([COLUMNS / 2, ROWS / 2])
+    while len(stream) < frames:
+        gesture = rng.choice([Gesture.DRAW] * 6 + [Gesture.HOVER, Gesture.ERASE, Gesture.TRANSLATE])
+        velocity = rng.normal(0, 6, 2)
+        for _ in range(int(rng.integers(10, 40))):
+            position = np.clip(position + velocity, 100, (COLUMNS - 100, ROWS - 100))
+            stream.append(synthetic_hand(gesture, position, rng=rng))
+    return stream[:frames]
+
+def populated_canvas(points, shapes, rng):
+    """A canvas holding points points worth of finished strokes and shapes circles and squares"""
+    canvas = Canvas(ROWS, COLUMNS)
+    lines = []
+    for _ in range(max(1, points // STROKE_POINTS)):
+        start = rng.integers((0, 0), (ROWS, COLUMNS))
+        steps = rng.integers(-3, 4, (STROKE_POINTS, 2))
+        stroke = np.clip(start + np.cumsum(steps, axis=0), 0, (ROWS - 1, COLUMNS - 1)).astype(np.int32)
+        line = Line(rng.choice(canvas.colors), stroke[0])
+        line.points = stroke
+        line.id = canvas.next_line_id
+        line.active = False
+        canvas.next_line_id += 1
+        lines.append(line)
+    canvas.add_shapes(lines, (), ())
+    for i in range(shapes):
+        r, c = (int(v) for v in rng.integers((50, 50), (ROWS - 50, COLUMNS - 50)))
+        color = canvas.colors[i % len(canvas.colors)]
+        if i % 2:
+            canvas.circles.append(color, origin=(r, c), radius=int(rng.integers(5, 50)))
+        else:
+            canvas.squares.append(color, anchor=(r, c), opposite=(r + int(rng.integers(5, 50)), c + int(rng.integers(5, 50))))
+    return canvas
+
+
+def measure(op, repeat, warmup=3):
+    """Calls op() repeat times, returns per call latency stats (ms) and allocation stats (bytes)"""
+    for _ in range(warmup):
+        op()
+    times = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        op()
+        times[i] = time.perf_counter() - start
+    times *= 1000
+
+    # allocations in a separate pass, tracemalloc slows everything down too much to time under it
+    alloc_runs = min(repeat, 20)
+    peaks = np.empty(alloc_runs)
+    retained = np.empty(alloc_runs)
+    tracemalloc.start()
+    for i in range(alloc_runs):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        op()
+        current, peak = tracemalloc.get_traced_memory()
+        peaks[i] = peak - before
+        retained[i] = current - before
+    tracemalloc.stop()
+
+    p50, p90, p99 = np.percentile(times, [50, 90, 99])
+    return {
+        'calls': repeat,
+        'mean_ms': float(times.mean()),
+        'p50_ms': float(p50),
+        'p90_ms': float(p90),
+        'p99_ms': float(p99),
+        'max_ms': float(times.max()),
+        'alloc_peak_bytes': float(np.median(peaks)),
+        'alloc_retained_bytes': float(np.median(retained)),
+    }
+
+
+def bench_landmark_smoothing(repeat, rng):
+    stream = [synthetic_hand(Gesture.DRAW, (500, 500), rng=rng) for _ in range(64)]
+    results = []
+    for name, smoother in (('landmark_buffer', LandmarkBuffer(5)), ('one_euro', OneEuroFilter())):
+        frame = [0]
+        def op():
+            smoother.push_landmark(stream[frame[0] % len(stream)], frame[0] / 30)
+            smoother.smoothed_landmarks()
+            smoother.displacement()
+            frame[0] += 1
+        results.append((f'{name}.push', '', measure(op, repeat * 10)))
+    return results
+
+def bench_detect_gesture(repeat, rng):
+    detector = HandDetector()
+    hands = [synthetic_hand(gesture, (500, 500), rng=rng) for gesture in EXTENDED]
+    # make sure the generated hands actually are the gestures they claim to be
+    for gesture, hand in zip(EXTENDED, hands):
+        assert detector.detect_gesture(hand) == gesture, gesture
+    frame = [0]
+    def op():
+        detector.detect_gesture(hands[frame[0] % len(hands)])
+        frame[0] += 1
+    return [('hands.detect_gesture', '', measure(op, repeat * 10))]
+
+def bench_frame_loop(repeat, rng, points, shapes):
+    """Landmarks -> metadata -> update_and_draw, the whole per frame path minus Mediapipe"""
+    canvas = populated_canvas(points, shapes, rng)
+    detector = HandDetector()
+    stream = gesture_stream(max(repeat * 2, 200), rng)
+    background = rng.integers(0, 255, FRAME_SHAPE, dtype=np.uint8)
+    frame = np.empty_like(background)
+    index = [0]
+    def op():
+        i = index[0] % len(stream)
+        np.copyto(frame, background)
+        hands_metadata = detector.hands_metadata_from_landmarks([(stream[i], 'Right')], i / 30)
+        canvas.update_and_draw(frame, hands_metadata)
+        index[0] += 1
+    return [('canvas.update_and_draw', f'{points}pts/{shapes}shapes', measure(op, repeat))]
+
+def bench_erase(repeat, rng, points, shapes):
+    canvas = populated_canvas(points, shapes, rng)
+    targets = rng.integers((0, 0), (ROWS, COLUMNS), (256, 2)).tolist()
+    index = [0]
+    def op():
+        canvas.erase_mode(tuple(targets[index[0] % len(targets)]), 40)
+        index[0] += 1
+    def erase_and_restore():
+        op()
+        canvas.undo() # keeps the canvas the same size from call to call
+    stats = measure(erase_and_restore, repeat)
+    return [('canvas.erase_mode+undo', f'{points}pts/{shapes}shapes', stats)]
+
+def bench_translate(repeat, rng, points, shapes):
+    canvas = populated_canvas(points, shapes, rng)
+    targets = rng.integers((100, 100), (ROWS - 100, COLUMNS - 100), (256, 2)).tolist()
+    index = [0]
+    def op():
+        # there and back again so nothing drifts off screen
+        target = tuple(targets[index[0] % len(targets)])
+        shift = (1, -1) if index[0] % 2 == 0 else (-1, 1)
+        canvas.translate_mode(target, 80, shift)
+        index[0] += 1
+    return [('canvas.translate_mode', f'{points}pts/{shapes}shapes', measure(op, repeat))]
+
+def bench_draw(repeat, rng, points, shapes):
+    canvas = populated_canvas(points, shapes, rng)
+    frame = np.zeros(FRAME_SHAPE, dtype=np.uint8)
+    def draw_lines():
+        canvas.draw_lines(frame)
+    def render_layer():
+        canvas.layer_dirty = True
+        canvas.draw_layer(frame)
+    scale = f'{points}pts/{shapes}shapes'
+    return [('canvas.draw_lines', scale, measure(draw_lines, repeat)),
+            ('canvas.render_layer', scale, measure(render_layer, repeat))]
+
+
+# every benchmark with the names of the results it produces, scaled ones run once per entry of SCALES
+BENCHMARKS = [
+    (bench_landmark_smoothing, ('landmark_buffer.push', 'one_euro.push'), False),
+    (bench_detect_gesture, ('hands.detect_gesture',), False),
+    (bench_frame_loop, ('canvas.update_and_draw',), True),
+    (bench_erase, ('canvas.erase_mode+undo',), True),
+    (bench_translate, ('canvas.translate_mode',), True),
+    (bench_draw, ('canvas.draw_lines', 'canvas.render_layer'), True),
+]
+
+def run(repeat, name_filter=None, seed=0):
+    results = []
+    for bench, names, scaled in BENCHMARKS:
+        # filter before running, so unwanted benchmarks don't even build their canvases
+        if name_filter is not None and not any(name_filter in name for name in names):
+            continue
+        for scale_args in (SCALES if scaled else [()]):
+            for name, scale, stats in bench(repeat, np.random.default_rng(seed), *scale_args):
+                if name_filter is None or name_filter in name:
+                    results.append({'name': name, 'scale': scale, **stats})
+                    report(results[-1])
+    return results
+
+def report(result, baseline=None):
+    line = (f"{result['name']:<26} {result['scale']:<20} p50 {result['p50_ms']:8.3f}ms  p90 {result['p90_ms']:8.3f}ms  "
+            f"p99 {result['p99_ms']:8.3f}ms  alloc {result['alloc_peak_bytes'] / 1024:9.1f}KiB")
+    if baseline is not None:
+        line += f"  ({result['p50_ms'] / baseline['p50_ms']:.2f}x p50 vs baseline)"
+    print(line)
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='bench.py',
+        description='benchmark the canvas and gesture hot paths on synthetic data, no camera or mediapipe needed'
+    )
+    parser.add_argument("-o", "--output", default="bench_results.json", help="where to write the results as JSON")
+    parser.add_argument("-n", "--repeat", type=int, default=100, help="calls per benchmark")
+    parser.add_argument("--quick", action="store_true", help="10 calls per benchmark")
+    parser.add_argument("-k", "--filter", help="only run benchmarks whose name contains this")
+    parser.add_argument("--compare", help="results JSON of an earlier run to compare against")
+    args = parser.parse_args()
+
+    repeat = 10 if args.quick else args.repeat
+    results = run(repeat, args.filter)
+    with open(args.output, 'w') as f:
+        json.dump({
+            'meta': {
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'opencv': cv.__version__,
+                'machine': platform.machine(),
+                'repeat': repeat,
+            },
+            'results': results,
+        }, f, indent=2)
+    print("wrote", args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {(result['name'], result['scale']): result for result in json.load(f)['results']}
+        print("\ncompared to", args.compare)
+        for result in results:
+            report(result, baseline.get((result['name'], result['scale'])))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,17 @@
 import cv2 as cv
 import numpy as np
 
+from eventlog import GESTURES, NO_HANDS, frame_metadata
 from hands import Gesture, HandDetector
-from util import xy_euclidean_dist
+from history import Delta, History, Op
+from spatial import SpatialGrid
+from timing import NULL_TIMER
+from util import xy_euclidean_dist, within_segment, rdp_mask
 
+import math
 from enum import Enum
 
 # FIXME: 
-# use a good spatial query system (is just iterating over literally every point the best we can do?) 
-# Gauging this would need the following:
-#   How many data points could i realistically collect over a 2-minute episode?
-#   How much does it cost to iterate and compare versus 
-#       1. storing waypoints in a grid, and then searching every pixel in the grid
-#       2. Storing all points in some sort of query system (intuition screaming quadtree).
 # have consistent usage of row, col convention between mediapipe, canvas, and opencv. 
 # keep all data intialized at startup and only completely transform in function
 
@@ -31,14 +30,32 @@ class Shape(Enum):
     SQUARE = Color.GRAY
     LINE = Color.GREEN
 
+# stroke widths (pixels) everything gets drawn with
+LINE_THICKNESS = 5
+CIRCLE_THICKNESS = 3
+SQUARE_THICKNESS = 5
+
 class Canvas():
     """ 
     This class is responsible for "drawing" all state onto the screen. 
     This includes the actual dashboard hands interact with as well as lines, backgrounds, etc.
 
     This component is intended to take (frame, hands_state) -> (update state) -> image to render
+
+    Stroke simplification knobs:
+        min_point_distance: samples closer than this (pixels) to the last kept point are dropped
+        simplify_tolerance: how far (pixels) a point may sit off the line through its neighbours before it has to be kept, 0 disables
+        resimplify_on_end: run a full Ramer-Douglas-Peucker pass over each stroke once it is finished
+
+    history_budget is roughly how many bytes of undo history to keep around before forgetting the oldest steps.
+
+    timer (a timing.StageTimer) gets how long update_state and draw_canvas take in update_and_draw.
+
+    Every hand draws with its own Pen (active line/circle/square, last gesture), picked by the 'hand' id in its metadata.
+    currLine/currCircle/currSquare are the ones of the pen in use, the color and shape selection is shared.
     """
-    def __init__(self, rows, columns):
+    def __init__(self, rows, columns, min_point_distance=2, simplify_tolerance=1.0, resimplify_on_end=True,
+                 history_budget=8 * 1024 * 1024, timer=None):
         # FIXME: just make this deterministic via list
         self.colors = [ Color.BLUE, Color.GREEN, Color.RED ]
         self.shapes = [ Shape.LINE, Shape.CIRCLE, Shape.SQUARE ]
@@ -46,21 +63,113 @@ class Canvas():
         self.columns = columns
         self.color = Color.BLUE # only really used to initialize lines
         self.shape = Shape.LINE
-        self.lines = {} # whole list of points
-        self.circles = [] # whole list of points
-        self.squares = [] # whole list of squares
-        self.currLine = Line(None, self.color)# this is the line we're adding to 
-        self.currLine.active = False
-        self.currCircle = Circle((-1, -1), -1, self.color)# this is the line we're adding to 
-        self.currCircle.active = False
-        self.currSquare = Square((-1, -1), (-1, -1), self.color)
-        self.currSquare.active = False
+        self.lines = {} # stroke id -> Line
+        self.next_line_id = 0
+        self.circles = CircleTable() # every circle, one row each
+        self.squares = SquareTable() # every square, one row each
+        # hand id -> what that hand is drawing, pen is the one in use (currLine etc. point into it)
+        self.pens = {0: Pen(self.color)}
+        self.pen = self.pens[0]
         self.blackout_background = False
+        self.min_point_distance = min_point_distance
+        self.simplify_tolerance = simplify_tolerance
+        self.resimplify_on_end = resimplify_on_end
+        # undo/redo, one step per gesture
+        self.history = History(history_budget)
+        # callables that get every Delta applied to the canvas (session log, ...)
+        self.listeners = []
+        # every line on the canvas lives in here too, keyed by the object itself.
+        # circles and squares don't need it, their tables hit-test everything at once
+        self.index = SpatialGrid()
+        # offscreen raster of every finished shape, only redrawn when erase/translate/clear changes it
+        self.layer = None
+        self.layer_mask = None
+        self.layer_dirty = True
+        # button layout, the pre-rendered buttons and the pixel -> button lookup, all rebuilt only when they go stale
+        self.buttons_cache_shape = None
+        self.buttons_cache = None
+        self.button_overlay_key = None
+        self.button_overlay = None
+        self.button_overlay_mask = None
+        self.button_label_map_shape = None
+        self.button_label_map = None
+        # scratch buffers for draw_canvas, reallocated only when the frame shape changes
+        self.blackout_frame = None
+        self.cursor_buffer = None
+        self.timer = timer if timer is not None else NULL_TIMER
+
+    @property
+    def currLine(self):
+        """this is the line we're adding to"""
+        return self.pen.line
+
+    @currLine.setter
+    def currLine(self, line):
+        self.pen.line = line
+
+    @property
+    def currCircle(self):
+        """view of the circle being drawn, if any"""
+        return self.pen.circle
+
+    @currCircle.setter
+    def currCircle(self, circle):
+        self.pen.circle = circle
+
+    @property
+    def currSquare(self):
+        """view of the square being drawn, if any"""
+        return self.pen.square
+
+    @currSquare.setter
+    def currSquare(self, square):
+        self.pen.square = square
+
+    @property
+    def skipped_points(self):
+        """points of the active line folded into its last point"""
+        return self.pen.skipped_points
+
+    @skipped_points.setter
+    def skipped_points(self, points):
+        self.pen.skipped_points = points
+
+    @property
+    def last_gesture(self):
+        return self.pen.last_gesture
+
+    @last_gesture.setter
+    def last_gesture(self, gesture):
+        self.pen.last_gesture = gesture
+
+    def use_pen(self, hand):
+        """Makes hand's pen the one in use, creating it if this hand is new"""
+        pen = self.pens.get(hand)
+        if pen is None:
+            pen = self.pens[hand] = Pen(self.color)
+        self.pen = pen
+        return pen
+
+    def active_shape_ids(self):
+        """(circle ids, square ids) being drawn by any pen right now"""
+        circle_ids = {pen.circle.id for pen in self.pens.values() if pen.circle is not None}
+        square_ids = {pen.square.id for pen in self.pens.values() if pen.square is not None}
+        return circle_ids, square_ids
 
     def switch_background(self):
         self.blackout_background = not self.blackout_background
 
     def get_buttons_coords(self, frame_shape):
+        """
+        Cached version of compute_buttons_coords, the layout only changes when the frame shape does.
+        """
+        frame_shape = tuple(frame_shape)
+        if self.buttons_cache_shape != frame_shape:
+            self.buttons_cache = self.compute_buttons_coords(frame_shape)
+            self.buttons_cache_shape = frame_shape
+        return self.buttons_cache
+
+    def compute_buttons_coords(self, frame_shape):
         """
         Returns coordinates of the buttons (and colors) to draw on the UI, used to save space later on.
         Should be useful for detecting overlap between fingers and buttons.
@@ -137,6 +246,70 @@ class Canvas():
         
         return coords
 
+    def get_button_actions(self):
+        """What each button does, in the same order as get_buttons_coords: None for clear, then Colors, then Shapes"""
+        return [None] + self.colors + list(Shape)
+
+    def get_button_label_map(self, frame_shape):
+        """
+        Returns a (rows, cols) uint8 image where each pixel holds 1 + the index of the button covering it, 0 if none.
+        Lets us hit-test a fingertip with a single lookup.
+        """
+        frame_shape = tuple(frame_shape)
+        if self.button_label_map_shape != frame_shape:
+            label_map = np.zeros(frame_shape[:2], dtype=np.uint8)
+            for i, button_metadata in enumerate(self.get_buttons_coords(frame_shape)):
+                button_left, button_top = button_metadata[2]
+                button_right, button_bottom = button_metadata[3]
+                label_map[button_top:button_bottom + 1, button_left:button_right + 1] = i + 1
+            self.button_label_map = label_map
+            self.button_label_map_shape = frame_shape
+        return self.button_label_map
+
+    def get_button_overlay(self, frame_shape):
+        """
+        Returns (pixels, mask) of the pre-rendered button bar for the frame shape and current color/shape selection.
+        """
+        key = (tuple(frame_shape), self.color, self.shape)
+        if self.button_overlay_key == key:
+            return self.button_overlay, self.button_overlay_mask
+
+        overlay = np.zeros(frame_shape, dtype=np.uint8)
+        mask = np.zeros(frame_shape[:2], dtype=np.uint8)
+        for button_metadata in self.get_buttons_coords(frame_shape):
+            button_str = button_metadata[0]
+            button_color_rgb = button_metadata[1]
+            button_left, button_top = button_metadata[2]
+            button_right, button_bottom = button_metadata[3]
+
+            for img, color in ((overlay, button_color_rgb), (mask, 1)):
+                cv.rectangle(img, 
+                            (button_left, button_top),
+                            (button_right, button_bottom),
+                            color, -1)
+
+            button_width = button_right - button_left
+            button_height = button_bottom - button_top
+            text_origin = (button_left + int((button_width)* .3), int(button_top + button_height * .5))
+
+            cv.putText(overlay, button_str, text_origin,
+                    cv.FONT_HERSHEY_SIMPLEX, .5, Color.WHITE.value, 2, cv.LINE_AA)
+            cv.putText(mask, button_str, text_origin,
+                    cv.FONT_HERSHEY_SIMPLEX, .5, 1, 2)
+            # highlight selected color
+            if button_str == self.color.name or button_str == self.shape.name:
+                for img, color in ((overlay, Color.WHITE.value), (mask, 1)):
+                    cv.rectangle(img, 
+                        (button_left, button_top),
+                        (button_right, button_bottom),
+                        color,
+                        2)
+
+        self.button_overlay_key = key
+        self.button_overlay = overlay
+        self.button_overlay_mask = mask
+        return overlay, mask
+
     def buttons_overlap(self, buttons_coords, fingertip_point):
         leftCoord, topCoord = buttons_coords[0]
         rightCoord, bottomCoord = buttons_coords[1]
@@ -147,49 +320,63 @@ class Canvas():
     def update_state(self, frame_shape, data = {}):
         """
         This function should take in state updates from our hands, and update internal state of the game.
+        data is one hand's metadata dict or a list of them (one per hand, told apart by their 'hand' id, 0 if missing).
+        Pens of hands missing from a list get their drawing ended and are dropped.
         """
-        buttons_coord = self.get_buttons_coords(frame_shape)
-        clear_button = buttons_coord[0]
-        button_offset = 1
-        color_buttons = buttons_coord[button_offset:button_offset+len(self.colors)]
-        button_offset += len(self.colors)
-        shape_buttons = buttons_coord[button_offset:button_offset+len(Shape)]
+        hands = data if isinstance(data, list) else [data]
+        label_map = self.get_button_label_map(frame_shape)
+        button_actions = self.get_button_actions()
+
+        seen = set()
+        for hand_data in hands:
+            hand = hand_data.get('hand', 0)
+            seen.add(hand)
+            self.use_pen(hand)
+            self.update_hand(label_map, button_actions, hand_data)
+
+        for hand in [hand for hand in self.pens if hand not in seen]:
+            self.pen = self.pens.pop(hand)
+            self.end_drawing()
+        # there's always a pen in use, for whatever gets called outside update_state
+        self.pen = self.pens[hands[-1].get('hand', 0)] if hands else self.use_pen(0)
 
+    def update_hand(self, label_map, button_actions, data):
+        """Applies one hand's metadata with the pen in use"""
+        frame_rows, frame_cols = label_map.shape
         gesture = data.get("gesture", Gesture.HOVER)
+        if gesture != self.last_gesture:
+            if gesture in (Gesture.ERASE, Gesture.TRANSLATE):
+                # finish (and log the ADD of) whatever was being drawn in its own step, before it can be erased or moved
+                self.end_drawing()
+            self.history.seal()
+            self.last_gesture = gesture
 
-        gesture_finger_points = [v for k, v in data.items() if k.endswith("_tip")]
         # check if any of the active vector points overlap with our buttons coordinates
-
-        # overlap with clear button
-        for coord in gesture_finger_points:
-            if self.buttons_overlap(clear_button[2:], coord):
-                # Clear state.
-                self.end_drawing()
-                self.lines = {}
-                self.circles = []
-                self.squares = []
-                break
-        
-        # overlap with color button
-        for color_button_metadata in color_buttons:
-            button_color_str = color_button_metadata[0]
-            for coord in gesture_finger_points:
-                if self.buttons_overlap(color_button_metadata[2:], coord):
-                    new_color = [color for color in self.colors if color.name == button_color_str][0]
-                    if gesture == Gesture.DRAW:
-                        self.end_drawing()
-                    # assign the color value to our metadata
-                    self.color = new_color
-
-        # overlap with shape button
-        for shape_button_metadata in shape_buttons:
-            shape_str = shape_button_metadata[0]
-            for coord in gesture_finger_points:
-                if self.buttons_overlap(shape_button_metadata[2:], coord):
-                    new_shape = [shape for shape in self.shapes if shape.name == shape_str][0]
-                    if new_shape != self.shape and Gesture.DRAW:
-                        self.end_drawing()
-                    self.shape = new_shape
+        pressed = set()
+        for k, v in data.items():
+            if k.endswith("_tip"):
+                # fingertips are averaged floats, a point is on a button only if both its floor and ceil pixels are
+                r_low, c_low = math.floor(v[0]), math.floor(v[1])
+                r_high, c_high = math.ceil(v[0]), math.ceil(v[1])
+                if 0 <= r_low and r_high < frame_rows and 0 <= c_low and c_high < frame_cols:
+                    label = label_map[r_low, c_low]
+                    if label and label == label_map[r_high, c_high]:
+                        pressed.add(label - 1)
+
+        # buttons are ordered clear -> colors -> shapes, same order we react to them in
+        for button in sorted(pressed):
+            action = button_actions[button]
+            if action is None:
+                self.clear()
+            elif isinstance(action, Color):
+                if gesture == Gesture.DRAW:
+                    self.end_drawing()
+                # assign the color value to our metadata
+                self.color = action
+            elif isinstance(action, Shape):
+                if action != self.shape:
+                    self.end_drawing()
+                self.shape = action
 
         if gesture == Gesture.DRAW:
             midpoint_r, midpoint_c = data.get('origin')
@@ -222,79 +409,146 @@ class Canvas():
         Renders dashboard onto screen
         """
         if self.blackout_background:
-            frame = np.zeros_like(frame)
-
-        buttons_coord = self.get_buttons_coords(frame.shape)
-
-        for button_metadata in buttons_coord:
-            button_str = button_metadata[0]
-            button_color_rgb = button_metadata[1]
-            button_left, button_top = button_metadata[2]
-            button_right, button_bottom = button_metadata[3]
-
-            frame = cv.rectangle(frame, 
-                                (button_left, button_top),
-                                (button_right, button_bottom),
-                                button_color_rgb, -1)
-
-            button_width = button_right - button_left
-            button_height = button_bottom - button_top
+            # reuse one black frame instead of allocating a new one every time
+            if self.blackout_frame is None or self.blackout_frame.shape != frame.shape:
+                self.blackout_frame = np.zeros_like(frame)
+            else:
+                self.blackout_frame.fill(0)
+            frame = self.blackout_frame
+
+        overlay, overlay_mask = self.get_button_overlay(frame.shape)
+        cv.copyTo(overlay, overlay_mask, frame)
+
+        # one cursor per hand
+        for hand_data in (data if isinstance(data, list) else [data]):
+            gesture = hand_data.get('gesture')
+            # purple cuz im royal, yellow ring for the eraser, white for translation
+            cursor_color = {
+                Gesture.DRAW: Color.PURPLE,
+                Gesture.ERASE: Color.YELLOW,
+                Gesture.TRANSLATE: Color.WHITE,
+            }.get(gesture)
+            if cursor_color is not None:
+                self.draw_cursor(frame, hand_data['origin'], hand_data['radius'], cursor_color.value)
+
+        frame = self.draw_layer(frame)
+
+        # the shapes being drawn right now are the only things rasterized every frame
+        for pen in self.pens.values():
+            if pen.line.active:
+                self.draw_line(frame, pen.line, pen.line.color.value)
+            if pen.circle is not None:
+                self.draw_circle(frame, pen.circle, pen.circle.color.value)
+            if pen.square is not None:
+                self.draw_square(frame, pen.square, pen.square.color.value)
 
-            cv.putText(frame, button_str, 
-                    (button_left + int((button_width)* .3), int(button_top + button_height * .5)), 
-                    cv.FONT_HERSHEY_SIMPLEX, .5, Color.WHITE.value, 2, cv.LINE_AA)
-            # highlight selected color
-            if button_str == self.color.name or button_str == self.shape.name:
-                frame = cv.rectangle(frame, 
-                    (button_left, button_top),
-                    (button_right, button_bottom),
-                    Color.WHITE.value,
-                    2)
+        return frame
+    
+    def draw_cursor(self, frame, origin, radius, color, alpha=0.4):
+        """
+        Blends a filled circle into frame in place, with some opacity.
+        Only the circle's bounding box is copied and blended, in a scratch buffer that is reused across frames.
+        """
+        midpoint_r, midpoint_c = origin
+        radius = int(radius)
+        frame_rows, frame_cols = frame.shape[:2]
+        top, bottom = max(midpoint_r - radius, 0), min(midpoint_r + radius + 1, frame_rows)
+        left, right = max(midpoint_c - radius, 0), min(midpoint_c + radius + 1, frame_cols)
+        if top >= bottom or left >= right:
+            return
 
-        gesture = data.get('gesture')
-        if gesture == Gesture.DRAW:
-            midpoint_r, midpoint_c = data['origin']
-            radius = data['radius'] 
-
-            img = frame.copy()
-            # purple cuz im royal
-            cv.circle(img, (midpoint_c, midpoint_r), int(radius), Color.PURPLE.value, -1)
-            alpha = 0.4
-            frame = cv.addWeighted(frame, alpha, img, 1-alpha, 0)
- 
-        # draw the ring if we're in the eraser mode
-        if gesture == Gesture.ERASE:
-            # get middle finger and radius of circle to draw
-            midpoint_r, midpoint_c = data['origin']
-            radius = data['radius']
-
-            # put circle on the map, and add some opacity
-            img = frame.copy()
-            cv.circle(img, (midpoint_c, midpoint_r), int(radius), Color.YELLOW.value, -1)
-            alpha = 0.4
-            frame = cv.addWeighted(frame, alpha, img, 1-alpha, 0)
+        if self.cursor_buffer is None or self.cursor_buffer.shape != frame.shape:
+            self.cursor_buffer = np.empty_like(frame)
 
-        elif gesture == Gesture.TRANSLATE:
-            midpoint_r, midpoint_c = data['origin']
-            radius = data['radius']
-
-            # put circle on the map, and add some opacity
-            img = frame.copy()
-            cv.circle(img, (midpoint_c, midpoint_r), int(radius), Color.WHITE.value, -1)
-            alpha = 0.4
-            frame = cv.addWeighted(frame, alpha, img, 1-alpha, 0)
-        
-        frame = self.draw_lines(frame)
-        frame = self.draw_circles(frame)
-        frame = self.draw_squares(frame)
+        roi = frame[top:bottom, left:right]
+        img = self.cursor_buffer[:bottom - top, :right - left]
+        img[:] = roi
+        cv.circle(img, (midpoint_c - left, midpoint_r - top), radius, color, -1)
+        cv.addWeighted(roi, alpha, img, 1-alpha, 0, dst=roi)
 
-        return frame
-    
     def update_and_draw(self, frame, data = {}):
+        start = self.timer.start()
         self.update_state(frame.shape, data)
+        self.timer.stop('update_state', start)
+        start = self.timer.start()
         frame = self.draw_canvas(frame, data)
+        self.timer.stop('draw_canvas', start)
         return frame
 
+    def replay_events(self, frame_shape, events):
+        """
+        Applies a gesture log (HAND_EVENT records, see eventlog.py) and ends up exactly where calling update_state
+        on every frame would have, only a lot faster:
+            - button presses get hit-tested for the whole log at once
+            - a frame that just carries on with what the frame before it did (same single hand, same gesture,
+              no button) skips update_state. Runs of those are applied in one go: DRAW points straight into the pen's
+              shape with the spatial index caught up once at the end, ERASE and TRANSLATE straight into their
+              modes, HOVER and frames without hands need nothing at all
+            - nothing gets rasterized, the layer is redrawn once the next time the canvas is drawn
+        """
+        if not len(events):
+            return
+        self.layer_dirty = True
+        pressed = self.tips_pressed(self.get_button_label_map(frame_shape), events['tips'])
+
+        bounds = np.flatnonzero(np.diff(events['frame'], prepend=-1, append=-1))
+        first = bounds[:-1] # first record of every frame
+        single = np.diff(bounds) == 1
+        hands = events['hand'][first]
+        gestures = events['gesture'][first]
+        continues = np.zeros(len(first), dtype=bool)
+        continues[1:] = (single[1:] & single[:-1] & (hands[1:] == hands[:-1]) & (gestures[1:] == gestures[:-1])
+                         & ~pressed[first[1:]])
+
+        frame, frames = 0, len(first)
+        while frame < frames:
+            if not continues[frame]:
+                self.update_state(frame_shape, frame_metadata(events[bounds[frame]:bounds[frame + 1]]))
+                frame += 1
+                continue
+            end = frame
+            while end < frames and continues[end]:
+                end += 1
+            run = events[first[frame:end]]
+            if run[0]['hand'] != NO_HANDS:
+                self.continue_gesture(GESTURES[run[0]['gesture']], run)
+            frame = end
+
+    def tips_pressed(self, label_map, tips):
+        """update_hand's button hit-test for every record at once: tips is (N, 4, 2), True where any of them is on a button"""
+        frame_rows, frame_cols = label_map.shape
+        low = np.floor(tips).astype(np.int64)
+        high = np.ceil(tips).astype(np.int64)
+        inside = (low >= 0).all(axis=-1) & (high[..., 0] < frame_rows) & (high[..., 1] < frame_cols)
+        low[~inside] = 0
+        high[~inside] = 0
+        label = label_map[low[..., 0], low[..., 1]]
+        return (inside & (label != 0) & (label == label_map[high[..., 0], high[..., 1]])).any(axis=-1)
+
+    def continue_gesture(self, gesture, run):
+        """Applies a run of records that all carry on the pen in use's current gesture, see replay_events"""
+        origins = [tuple(origin) for origin in run['origin'].tolist()]
+        if gesture == Gesture.DRAW:
+            if self.shape == Shape.LINE:
+                for origin in origins:
+                    self.push_point(origin, index=False)
+                if self.currLine.active:
+                    self.index_line(self.currLine)
+            else:
+                update = self.update_circle if self.shape == Shape.CIRCLE else self.update_square
+                for origin in origins:
+                    update(origin)
+        elif gesture == Gesture.ERASE:
+            for origin, radius in zip(origins, run['radius'].tolist()):
+                self.erase_mode(origin, int(radius))
+        elif gesture == Gesture.TRANSLATE:
+            # lines usually get dragged along for many frames, reindex each one once instead of every frame
+            unindexed = {}
+            for origin, radius, shift in zip(origins, run['radius'].tolist(), run['shift'].tolist()):
+                self.translate_mode(origin, int(radius), tuple(shift), unindexed)
+            for line in unindexed.values():
+                self.index_line(line)
+
     def update_circle(self, new_point):
         """ Maintain state of the currently drawn circle. If it doesnt exist, initialize it and pass pointer to self.circles"""
         point_row, point_col = new_point
@@ -302,9 +556,8 @@ class Canvas():
         if not (0 <= point_row < self.rows and 0 <= point_col < self.columns):
             return
         
-        if self.currCircle.active == False:
-            self.currCircle = Circle((point_row, point_col), 5, self.color)
-            self.circles.append(self.currCircle)
+        if self.currCircle is None:
+            self.currCircle = self.circles.append(self.color, origin=(point_row, point_col), radius=5)
         else:
             dist = int(xy_euclidean_dist(self.currCircle.origin, new_point))
             self.currCircle.radius = dist
@@ -316,40 +569,243 @@ class Canvas():
         if not (0 <= point_row < self.rows and 0 <= point_col < self.columns):
             return
 
-        if self.currSquare.active == False:
+        if self.currSquare is None:
             # just initialize with some size
-            self.currSquare = Square(new_point, (point_row + 5, point_col + 5), self.color)
-            self.squares.append(self.currSquare)
+            self.currSquare = self.squares.append(self.color, anchor=new_point, opposite=(point_row + 5, point_col + 5))
         else:
             self.currSquare.opposite = new_point
 
-    def push_point(self, point):
+    def push_point(self, point, index=True):
         """
         adds a point to draw later on
 
         Arguments: 
             point: (r, c) pair describing new coordinate of the line
+            index: False leaves the new segment out of the spatial index, the caller reindexes the line itself
         """
 
         row, col = point 
         if not 0 <= row < self.rows or not 0 <= col < self.columns:
             return
-        # TODO: replace hashmap approach with just generic list
         # if there isn't an active line being drawn, start one
         if self.currLine.active == False:
             # we need to initialize a line
             line = Line(self.color, point) # start a line with a new color
+            line.id = self.next_line_id
             self.currLine = line
-            self.lines[point] = self.currLine # store origin in the lines
+            self.lines[line.id] = self.currLine
+            self.next_line_id += 1
+            self.index.insert_segment(line, point, point)
+            self.skipped_points = []
+        else:
+            line = self.currLine
+            last = tuple(line.buffer[line.size - 1].tolist())
+            # hand barely moved, nothing worth storing
+            if xy_euclidean_dist(last, point) < self.min_point_distance:
+                return
+            if index:
+                self.index.insert_segment(line, last, point)
+            # if the last point (and everything already folded into it) stays within tolerance of the
+            # segment from the point before it to the new one, slide it forward instead of appending
+            if line.size >= 2 and self.simplify_tolerance > 0 and len(self.skipped_points) < 64:
+                self.skipped_points.append(last)
+                if within_segment(self.skipped_points, line.buffer[line.size - 2].tolist(), point, self.simplify_tolerance):
+                    line.replace_last(point)
+                    return
+            line.append_point(point)
+            self.skipped_points = []
+
+    def clear(self):
+        """Wipes every shape off the canvas, as an undo step of its own"""
+        self.end_all_drawing()
+        self.history.seal()
+        self.record(Delta(Op.REMOVE, self.lines.values(),
+                          self.circles.take(self.circles.all_ids()), self.squares.take(self.squares.all_ids())))
+        self.history.seal()
+        self.lines = {}
+        self.circles.clear()
+        self.squares.clear()
+        self.index.clear()
+        self.layer_dirty = True
+
+    def undo(self) -> bool:
+        """Reverts the latest step in the history, returns False if there was nothing to undo"""
+        self.end_all_drawing()
+        deltas = self.history.pop_undo()
+        if deltas is None:
+            return False
+        for delta in deltas:
+            self.apply_delta(delta)
+            self.notify(delta)
+        return True
+
+    def redo(self) -> bool:
+        """Re-applies the latest undone step, returns False if there was nothing to redo"""
+        self.end_all_drawing()
+        deltas = self.history.pop_redo()
+        if deltas is None:
+            return False
+        for delta in deltas:
+            self.apply_delta(delta)
+            self.notify(delta)
+        return True
+
+    def record(self, delta):
+        """Stores a delta that was just applied in the history and hands it to every listener"""
+        if delta.is_empty():
+            return
+        self.history.record(delta)
+        self.notify(delta)
+
+    def notify(self, delta):
+        for listener in self.listeners:
+            listener(delta)
+
+    def apply_delta(self, delta):
+        """Applies a delta to the canvas without recording it"""
+        if delta.op == Op.ADD:
+            self.add_shapes(delta.lines, delta.circles, delta.squares)
+        elif delta.op == Op.REMOVE:
+            self.remove_shapes(delta.lines, delta.circles, delta.squares)
         else:
-            # get the current line, add the new point to the linked list
-            self.currLine.points.append(point)
+            self.shift_shapes(delta.lines, delta.circles, delta.squares, delta.shift)
+
+    def add_shapes(self, lines, circles, squares):
+        """
+        Puts finished shapes (back) on the canvas.
+        lines is a list of Line, circles and squares are ShapeRows (or empty)
+        """
+        for line in lines:
+            self.lines[line.id] = line
+            self.index.remove(line)
+        if lines:
+            # index every line in one go, this is what makes loading a big canvas fast
+            offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+            np.cumsum([line.size for line in lines], out=offsets[1:])
+            self.index.insert_polyline_runs(lines, np.concatenate([line.points for line in lines]), offsets)
+        for line in lines:
+            self.commit_to_layer(line)
+        for table, shape_rows in ((self.circles, circles), (self.squares, squares)):
+            if len(shape_rows):
+                table.insert_rows(shape_rows)
+                for shape_id in shape_rows.ids.tolist():
+                    self.commit_to_layer(table[shape_id])
+
+    def remove_shapes(self, lines, circles, squares):
+        """Takes shapes off the canvas, circles and squares are anything with an ids array"""
+        for line in lines:
+            self.lines.pop(line.id, None)
+            self.index.remove(line)
+            if line.active:
+                # erased mid-stroke, the next DRAW starts a fresh shape
+                line.active = False
+            else:
+                self.layer_dirty = True
+
+        for table, shape_rows in ((self.circles, circles), (self.squares, squares)):
+            if len(shape_rows):
+                table.remove(shape_rows.ids)
+                self.layer_dirty = True
+
+        # same deal as lines if a shape being drawn got erased
+        for pen in self.pens.values():
+            if pen.circle is not None and not pen.circle.alive:
+                pen.circle = None
+            if pen.square is not None and not pen.square.alive:
+                pen.square = None
+
+    def shift_shapes(self, lines, circles, squares, shift):
+        """Moves shapes by (dr, dc), no bounds checks, callers make sure the shift is valid"""
+        for line in lines:
+            line.points += np.asarray(shift, dtype=np.int32)
+            self.index_line(line)
+
+        self.circles.shift(getattr(circles, 'ids', ()), shift)
+        self.squares.shift(getattr(squares, 'ids', ()), shift)
+
+        if lines or len(circles) or len(squares):
+            self.layer_dirty = True
+
+    def index_line(self, line):
+        """(Re)inserts every segment of a line into the spatial index"""
+        self.index.remove(line)
+        self.index.insert_polyline(line, line.points)
+
+    def lines_near(self, position, radius, unindexed=None):
+        """
+        Returns the ids of the lines that have a point within radius of position.
+        unindexed holds lines (by id) that moved without the index hearing about it, those get checked regardless.
+        """
+        candidates = self.index.query(position, radius)
+        if unindexed:
+            candidates.update(unindexed.values())
+        line_ids = []
+        for obj in candidates:
+            if isinstance(obj, Line) and obj.overlaps_circle(position, radius):
+                line_ids.append(obj.id)
+        return sorted(line_ids)
+
+    def shapes_near(self, position, radius):
+        """Returns ShapeRows of the (circles, squares) whose border overlaps the circle at position"""
+        return (self.circles.take(self.circles.ids_overlapping(position, radius)),
+                self.squares.take(self.squares.ids_overlapping(position, radius)))
+
+    def finished_near(self, position, radius, unindexed=None):
+        """
+        (lines, circles, squares) near position like lines_near/shapes_near, minus the shapes some pen is still drawing.
+        Those have no ADD in the history yet, so erasing or moving them would log changes undo can't make sense of.
+        """
+        lines = [self.lines[line_id] for line_id in self.lines_near(position, radius, unindexed)]
+        lines = [line for line in lines if not line.active]
+        circles, squares = self.shapes_near(position, radius)
+        active_circles, active_squares = self.active_shape_ids()
+        if active_circles and len(circles):
+            circles = self.circles.take([i for i in circles.ids.tolist() if i not in active_circles])
+        if active_squares and len(squares):
+            squares = self.squares.take([i for i in squares.ids.tolist() if i not in active_squares])
+        return lines, circles, squares
 
     def end_drawing(self):
-        """Ends active drawing"""
+        """Ends active drawing, finished shapes get baked into the layer"""
+        if self.currLine.active and self.resimplify_on_end and self.simplify_tolerance > 0:
+            if self.currLine.simplify(self.simplify_tolerance):
+                self.index_line(self.currLine)
+
+        line = self.currLine if self.currLine.active else None
+        circle, square = self.currCircle, self.currSquare
         self.currLine.active = False
-        self.currCircle.active = False
-        self.currSquare.active = False
+        self.currCircle = None
+        self.currSquare = None
+        for shape in (line, circle, square):
+            if shape is not None:
+                self.commit_to_layer(shape)
+
+        if line or circle or square:
+            self.record(Delta(Op.ADD, [line] if line else [],
+                              self.circles.take([circle.id] if circle else []),
+                              self.squares.take([square.id] if square else [])))
+
+    def end_all_drawing(self):
+        """end_drawing for every pen"""
+        in_use = self.pen
+        for pen in list(self.pens.values()):
+            self.pen = pen
+            self.end_drawing()
+        self.pen = in_use
+
+    def draw_line(self, img, line, color):
+        if line.size < 2:
+            return
+        # opencv wants (x, y) so flip to (c, r) on the way out
+        cv.polylines(img, [np.ascontiguousarray(line.points[:, ::-1])], False, color, LINE_THICKNESS)
+
+    def draw_circle(self, img, circle, color):
+        orig_row, orig_col = circle.origin
+        cv.circle(img, (orig_col, orig_row), circle.radius, color, CIRCLE_THICKNESS)
+
+    def draw_square(self, img, square, color):
+        topRow, leftCol, bottomRow, rightCol = square.get_coords()
+        cv.rectangle(img, (leftCol, topRow), (rightCol, bottomRow), color, SQUARE_THICKNESS)
 
     def draw_lines(self, frame):
         """
@@ -361,104 +817,93 @@ class Canvas():
         Returns:
         Image with all the different lines drawn on top of it
         """
-        # self.lines = [{"color": "BLUE",
-        #               "points": [(1, 2), (5, 9), ...]}, 
-        #               {"color": "RED",
-        #               "points": [(6, 0), (5, 8), ...]}, 
         for line in self.lines.values():
-            for i, point in enumerate(line.points):
-                if i == 0:
-                    continue
-                prev_r, prev_c = line.points[i-1]
-                r, c = point
-                cv.line( 
-                        frame, 
-                        (prev_c, prev_r), 
-                        (c, r), 
-                        line.color.value,
-                        5
-                        )
+            self.draw_line(frame, line, line.color.value)
         return frame
     
     def draw_circles(self, frame):
         for circle in self.circles:
-            orig_row, orig_col = circle.origin
-            cv.circle(frame, (orig_col, orig_row), circle.radius, circle.color.value, 3)
+            self.draw_circle(frame, circle, circle.color.value)
         return frame
     
     def draw_squares(self, frame):
         for square in self.squares:
-            topRow, leftCol, bottomRow, rightCol = square.get_coords()
-            frame = cv.rectangle(
-                frame,
-                (leftCol, topRow),
-                (rightCol, bottomRow),
-                square.color.value,
-                5
-            )
+            self.draw_square(frame, square, square.color.value)
+        return frame
+
+    def commit_to_layer(self, shape):
+        """Rasterizes one finished shape into the layer (pixels + mask) without touching anything else"""
+        if self.layer is None or self.layer_dirty:
+            return # the next full render picks it up
+        if isinstance(shape, Line):
+            draw = self.draw_line
+        elif isinstance(shape, Circle):
+            draw = self.draw_circle
+        else:
+            draw = self.draw_square
+        draw(self.layer, shape, shape.color.value)
+        draw(self.layer_mask, shape, 1)
+
+    def render_layer(self):
+        """Re-rasterizes every finished shape from scratch, only needed after erase/translate/clear"""
+        self.layer.fill(0)
+        self.layer_mask.fill(0)
+        active_circles, active_squares = self.active_shape_ids()
+        for line in self.lines.values():
+            if not line.active:
+                self.commit_to_layer(line)
+        for circle in self.circles:
+            if circle.id not in active_circles:
+                self.commit_to_layer(circle)
+        for square in self.squares:
+            if square.id not in active_squares:
+                self.commit_to_layer(square)
+
+    def draw_layer(self, frame):
+        """Composites the cached layer of finished shapes onto frame in one masked copy"""
+        if self.layer is None or self.layer.shape != frame.shape:
+            self.layer = np.zeros_like(frame)
+            self.layer_mask = np.zeros(frame.shape[:2], dtype=np.uint8)
+            self.layer_dirty = True
+
+        if self.layer_dirty:
+            self.layer_dirty = False
+            self.render_layer()
+
+        # opencv's masked copy is ~20x faster than np.copyto(where=) with a broadcast mask
+        cv.copyTo(self.layer, self.layer_mask, frame)
         return frame
 
 
-    def translate_mode(self, position, radius, shift):
+    def translate_mode(self, position, radius, shift, unindexed=None):
         """
         Works as following:
 
-        1. gather all lines in the radius
+        1. gather all finished shapes in the radius (spatial index first, exact check after)
         2. for each line:
-            shift each point in the line by the shift variable
-        
-       """
-        # FIXME: introducing extra lines unnecessarily into the program
+            shift each point in the line by the shift variable, as long as it stays on screen
+        3. shift the circles and squares we found
 
-        r, c = position
+        With unindexed (a dict, see replay_events) moved lines are put in there instead of being reindexed,
+        the caller reindexes them all once at the end.
+       """
         if shift == (0, 0):
             return
 
-        # we should be able to collect all unique origin points 
-        uniqueLines = set()
-        for origin, line in self.lines.items():
-            for p in line.points:
-                if xy_euclidean_dist(p, position) <= radius:
-                    uniqueLines.add(origin)
-                    break
-        
-        # debugging line
-        sortedLines = sorted(list(uniqueLines))
-
-        # for each origin point in the circle
-        for og_point in sortedLines:
-            # Transform original points
-            line = self.lines[og_point]
-            translation = []
-            for r, c in line.points:
-                trans_r, trans_c = r + shift[0], c + shift[1]
-                if (0 <= trans_r < self.rows) and (0 <= trans_c < self.columns):
-                    translation.append((trans_r, trans_c))
+        lines, circles, squares = self.finished_near(position, radius, unindexed)
+        moved_lines = []
+        for line in lines:
+            # only move the line if all of it stays on screen
+            if line.translate(shift, self.rows, self.columns):
+                if unindexed is None:
+                    self.index_line(line)
                 else:
-                    break
-
-            # Check if transformation is valid
-            if len(translation) == len(line.points):
-                self.lines.pop(og_point)
+                    unindexed[line.id] = line
+                self.layer_dirty = True
+                moved_lines.append(line)
 
-                line.points = translation
-                new_origin = line.get_origin()
-                assert(og_point != new_origin)
-
-                # put the value back in the lines
-                self.lines[line.get_origin()] = line
-        
-        for i, circle in enumerate(self.circles):                
-            if circle.overlaps_circle(position, radius):
-                new_origin = (circle.origin[0] + shift[0], circle.origin[1] + shift[1])
-                circle.origin = new_origin
-
-        for i, square in enumerate(self.squares):
-            if square.overlaps_circle(position, radius):
-                new_anchor = square.anchor[0] + shift[0], square.anchor[1] + shift[1]
-                new_opposite = square.opposite[0] + shift[0], square.opposite[1] + shift[1]
-                square.anchor = new_anchor
-                square.opposite = new_opposite
+        self.shift_shapes([], circles, squares, shift)
+        self.record(Delta(Op.SHIFT, moved_lines, circles, squares, shift))
 
     # start of erase mode code
     def erase_mode(self, position, radius):
@@ -470,58 +915,304 @@ class Canvas():
             position: (x, y) coordinates of the position
             radius: the radius (in pixels) of our eraser
         """
-        origin_points = []
-        for origin, lines in self.lines.items():
-            for point in lines.points:
-                if xy_euclidean_dist(point, position) <= radius:
-                    origin_points.append(origin)
-                    break
+        lines, circles, squares = self.finished_near(position, radius)
+        self.remove_shapes(lines, circles, squares)
+        self.record(Delta(Op.REMOVE, lines, circles, squares))
 
-        for origins in origin_points:
-            self.lines.pop(origins)
+class Pen():
+    """What one hand is in the middle of drawing"""
 
-        circles_to_keep = []
-        for circle in self.circles:
-            if circle.overlaps_circle(position, radius):
-                continue
-            else:
-                circles_to_keep.append(circle)
-        self.circles = circles_to_keep
-
-        squares_to_keep = []
-        for square in self.squares:
-            if square.overlaps_circle(position, radius):
-                continue
-            else:
-                squares_to_keep.append(square)
-
-        self.squares = squares_to_keep
+    def __init__(self, color):
+        self.line = Line(color, (-1, -1))
+        self.line.active = False
+        self.circle = None
+        self.square = None
+        self.skipped_points = []
+        self.last_gesture = None
 
 class Line():
     """
-    Helper class to represent the lines put on the screen
+    Helper class to represent the lines put on the screen.
+
+    Points are (r, c) rows of a growable int32 array, doubled whenever it fills up,
+    so long strokes stay compact and can be moved/tested with whole-array operations.
     """
 
     def __init__(self, color: Color, origin):
+        self.id = None # assigned by the canvas
         self.color = color
-        self.points = [origin]
+        self.buffer = np.empty((16, 2), dtype=np.int32)
+        self.size = 0
         self.active = True
+        self.append_point(origin)
+
+    @property
+    def points(self):
+        """(N, 2) view of the points in the line, no copy"""
+        return self.buffer[:self.size]
+
+    @points.setter
+    def points(self, points):
+        points = np.asarray(points, dtype=np.int32).reshape(-1, 2)
+        self.buffer = np.empty((max(16, len(points)), 2), dtype=np.int32)
+        self.buffer[:len(points)] = points
+        self.size = len(points)
+
+    def append_point(self, point):
+        if self.size == len(self.buffer):
+            grown = np.empty((2 * len(self.buffer), 2), dtype=np.int32)
+            grown[:self.size] = self.buffer[:self.size]
+            self.buffer = grown
+        self.buffer[self.size] = point
+        self.size += 1
+
+    def replace_last(self, point):
+        self.buffer[self.size - 1] = point
+
+    def simplify(self, tolerance) -> bool:
+        """
+        Drops every point the Ramer-Douglas-Peucker pass says is redundant at the given tolerance.
+        Returns whether any point was removed.
+        """
+        keep = rdp_mask(self.points, tolerance)
+        if keep.all():
+            return False
+        self.points = self.points[keep]
+        return True
 
     def get_origin(self):
-        return self.points[0]
+        return tuple(self.buffer[0].tolist())
+
+    def translate(self, shift, rows, columns) -> bool:
+        """
+        Shifts every point by (dr, dc) if the whole line stays within rows x columns.
+        Returns whether the line moved.
+        """
+        points = self.points
+        low = points.min(axis=0) + shift
+        high = points.max(axis=0) + shift
+        if low[0] < 0 or low[1] < 0 or high[0] >= rows or high[1] >= columns:
+            return False
+        points += np.asarray(shift, dtype=np.int32)
+        return True
+
+    def overlaps_circle(self, point, radius) -> bool:
+        """True if any segment of the line passes within radius of point"""
+        points = self.points.astype(np.float64)
+        rel = np.asarray(point, dtype=np.float64) - points[:-1]
+        segments = points[1:] - points[:-1]
+        if len(segments) == 0:
+            rel = np.asarray(point, dtype=np.float64) - points
+            return bool((np.einsum('ij,ij->i', rel, rel) <= radius * radius).any())
+        # project onto each segment, clamped to its ends (zero length segments just measure to their start)
+        lengths = np.einsum('ij,ij->i', segments, segments)
+        t = np.clip(np.einsum('ij,ij->i', rel, segments) / np.maximum(lengths, 1e-12), 0, 1)
+        rel -= t[:, None] * segments
+        return bool((np.einsum('ij,ij->i', rel, rel) <= radius * radius).any())
+
+    def __len__(self):
+        return self.size
 
     def __repr__(self):
         return f"\ncolor({self.color}) \
                 \n\tactive({self.active}) \
-                \n\tpoints({self.points})"
+                \n\tpoints({self.points.tolist()})"
+
+# colors are stored in the shape tables as their index in here
+PALETTE = list(Color)
+
+class ShapeRows():
+    """
+    A detached batch of table rows (ids, colors and every column), e.g. what erase took off the canvas.
+    This is what the history keeps for circles and squares.
+    """
+    def __init__(self, ids, color_ids, columns):
+        self.ids = ids
+        self.color_ids = color_ids
+        self.columns = columns
 
-class Circle():
+    @property
+    def nbytes(self):
+        return self.ids.nbytes + self.color_ids.nbytes + sum(column.nbytes for column in self.columns.values())
+
+    def __len__(self):
+        return len(self.ids)
+
+class ShapeTable():
+    """
+    Structure-of-arrays storage for one kind of shape.
+
+    Every shape is a row: a stable id, a color id (index into PALETTE) and one int32 column per field.
+    Rows stay packed in insertion order, removing compacts the arrays, so hit-tests, removal and shifting
+    over every shape are a handful of numpy operations. Iterating (or indexing by id) hands out views.
+    """
+    fields = () # (name, width) pairs, filled in by subclasses
+    view = None # class of the views handed out
+
+    def __init__(self):
+        self.size = 0
+        self.next_id = 0
+        self.ids = np.empty(16, dtype=np.int64)
+        self.color_ids = np.empty(16, dtype=np.uint8)
+        self.columns = {name: np.empty((16, width), dtype=np.int32) for name, width in self.fields}
+        self.rows = {} # id -> row
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for shape_id in self.ids[:self.size].tolist():
+            yield self.view(self, shape_id)
+
+    def __getitem__(self, shape_id):
+        return self.view(self, shape_id)
+
+    def __contains__(self, shape_id):
+        return shape_id in self.rows
+
+    def column(self, name):
+        """(size, width) view of one column"""
+        return self.columns[name][:self.size]
+
+    def reserve(self, extra):
+        """Makes room for extra more rows, doubling capacity like Line does"""
+        capacity = len(self.ids)
+        if self.size + extra <= capacity:
+            return
+        while capacity < self.size + extra:
+            capacity *= 2
+        self.ids = np.resize(self.ids, capacity)
+        self.color_ids = np.resize(self.color_ids, capacity)
+        for name, width in self.fields:
+            grown = np.empty((capacity, width), dtype=np.int32)
+            grown[:self.size] = self.columns[name][:self.size]
+            self.columns[name] = grown
+
+    def append(self, color: Color, **values):
+        """Adds one shape with a fresh id, returns its view"""
+        self.reserve(1)
+        row = self.size
+        shape_id = self.next_id
+        self.next_id += 1
+        self.ids[row] = shape_id
+        self.color_ids[row] = PALETTE.index(color)
+        for name, _ in self.fields:
+            self.columns[name][row] = values[name]
+        self.rows[shape_id] = row
+        self.size += 1
+        return self.view(self, shape_id)
+
+    def take(self, ids):
+        """Copies the given rows out of the table"""
+        rows = self.rows_of(ids)
+        return ShapeRows(self.ids[rows], self.color_ids[rows], {name: self.columns[name][rows] for name, _ in self.fields})
+
+    def insert_rows(self, shape_rows: ShapeRows):
+        """Puts rows taken out earlier back at the end of the table, ids included"""
+        count = len(shape_rows)
+        self.reserve(count)
+        start, end = self.size, self.size + count
+        self.ids[start:end] = shape_rows.ids
+        self.color_ids[start:end] = shape_rows.color_ids
+        for name, _ in self.fields:
+            self.columns[name][start:end] = shape_rows.columns[name]
+        self.rows.update(zip(shape_rows.ids.tolist(), range(start, end)))
+        self.size = end
+        if count:
+            self.next_id = max(self.next_id, int(shape_rows.ids.max()) + 1)
+
+    def remove(self, ids):
+        """Drops the given ids, compacting every column in one pass"""
+        if len(ids) == 0:
+            return
+        keep = np.ones(self.size, dtype=bool)
+        keep[self.rows_of(ids)] = False
+        count = int(keep.sum())
+        self.ids[:count] = self.ids[:self.size][keep]
+        self.color_ids[:count] = self.color_ids[:self.size][keep]
+        for name, _ in self.fields:
+            self.columns[name][:count] = self.columns[name][:self.size][keep]
+        self.size = count
+        self.rows = dict(zip(self.ids[:count].tolist(), range(count)))
+
+    def shift(self, ids, shift):
+        """Moves every positional (2-wide) column of the given ids by (dr, dc)"""
+        if len(ids) == 0:
+            return
+        rows = self.rows_of(ids)
+        offset = np.asarray(shift, dtype=np.int32)
+        for name, width in self.fields:
+            if width == 2:
+                self.columns[name][rows] += offset
+
+    def clear(self):
+        self.size = 0
+        self.rows = {}
+
+    def rows_of(self, ids):
+        return np.fromiter((self.rows[shape_id] for shape_id in np.asarray(ids).tolist()), dtype=np.int64, count=len(ids))
+
+    def all_ids(self):
+        return self.ids[:self.size].copy()
+
+    def overlaps_circle(self, point, radius):
+        """Boolean mask over rows, true where the shape's border overlaps the circle"""
+        raise NotImplementedError
+
+    def ids_overlapping(self, point, radius):
+        """Ids of every shape whose border overlaps the circle at point"""
+        if self.size == 0:
+            return self.ids[:0].copy()
+        return self.ids[:self.size][self.overlaps_circle(point, radius)]
+
+class ShapeView():
+    """Lightweight handle on one row of a ShapeTable, reads and writes go straight to the arrays"""
+    def __init__(self, table: ShapeTable, shape_id):
+        self.table = table
+        self.id = shape_id
+
+    @property
+    def row(self):
+        return self.table.rows[self.id]
+
+    @property
+    def alive(self):
+        return self.id in self.table.rows
+
+    @property
+    def color(self):
+        return PALETTE[self.table.color_ids[self.row]]
+
+    def get_field(self, name):
+        value = self.table.columns[name][self.row]
+        return tuple(value.tolist()) if len(value) > 1 else int(value[0])
+
+    def set_field(self, name, value):
+        self.table.columns[name][self.row] = value
+
+    def __eq__(self, other):
+        return isinstance(other, ShapeView) and self.table is other.table and self.id == other.id
+
+    def __hash__(self):
+        return hash((id(self.table), self.id))
+
+class Circle(ShapeView):
     """Helper class to place circles on screen"""
-    def __init__(self, origin, radius: int, color: Color):
-        self.origin = origin
-        self.radius = radius
-        self.color = color
-        self.active = True
+    @property
+    def origin(self):
+        return self.get_field('origin')
+
+    @origin.setter
+    def origin(self, value):
+        self.set_field('origin', value)
+
+    @property
+    def radius(self):
+        return self.get_field('radius')
+
+    @radius.setter
+    def radius(self, value):
+        self.set_field('radius', value)
     
     def get_radius(self):
         return self.radius
@@ -535,12 +1226,22 @@ class Circle():
         return f"Origin:{self.origin}\tRadius:{self.radius}\tColor:{self.color}"
 
 
-class Square():
-    def __init__(self, anchor, opposite, color: Color):
-        self.anchor = anchor
-        self.opposite = opposite
-        self.color = color
-        self.active = True
+class Square(ShapeView):
+    @property
+    def anchor(self):
+        return self.get_field('anchor')
+
+    @anchor.setter
+    def anchor(self, value):
+        self.set_field('anchor', value)
+
+    @property
+    def opposite(self):
+        return self.get_field('opposite')
+
+    @opposite.setter
+    def opposite(self, value):
+        self.set_field('opposite', value)
 
     def get_coords(self):
         topRow = min(self.anchor[0], self.opposite[0])
@@ -601,6 +1302,46 @@ class Square():
         topRow, leftCol, bottomRow, rightCol = self.get_coords()
         return f"topLeft: {(topRow, leftCol)}\tbottomRight:{(bottomRow, rightCol)}\tcolor:{self.color}"
 
+class CircleTable(ShapeTable):
+    fields = (('origin', 2), ('radius', 1))
+    view = Circle
+
+    def overlaps_circle(self, point, radius):
+        """Vectorized Circle.overlaps_circle over every row"""
+        offsets = self.column('origin') - np.asarray(point, dtype=np.float64)
+        dist = np.sqrt(np.einsum('ij,ij->i', offsets, offsets))
+        radii = self.column('radius')[:, 0]
+        return (np.maximum(radii - radius, 0) <= dist) & (dist <= radii + radius)
+
+class SquareTable(ShapeTable):
+    fields = (('anchor', 2), ('opposite', 2))
+    view = Square
+
+    def get_coords(self):
+        """(top, left, bottom, right) columns for every row"""
+        anchor, opposite = self.column('anchor'), self.column('opposite')
+        top_left = np.minimum(anchor, opposite)
+        bottom_right = np.maximum(anchor, opposite)
+        return top_left[:, 0], top_left[:, 1], bottom_right[:, 0], bottom_right[:, 1]
+
+    def overlaps_circle(self, point, radius):
+        """Vectorized Square.overlaps_circle over every row, same math (and same quirks) row by row"""
+        point_r, point_c = point
+        topRow, leftCol, bottomRow, rightCol = self.get_coords()
+
+        point_dist_r = np.abs(point_r - (topRow + bottomRow) // 2)
+        point_dist_c = np.abs(point_c - (leftCol + rightCol) // 2)
+        half_height = (bottomRow - topRow) // 2
+        half_width = (rightCol - leftCol) // 2
+        square_border_row_dist = np.abs(point_dist_r - half_height)
+        square_border_col_dist = np.abs(point_dist_c - half_width)
+
+        too_far = (point_dist_r > half_height + radius) | (point_dist_c > half_width + radius)
+        too_close = (point_dist_r < half_height - radius) & (point_dist_c < half_width - radius)
+        near_corner = (point_dist_r > half_width) & (point_dist_c > half_height)
+        corner_hit = square_border_col_dist ** 2 + square_border_row_dist ** 2 <= radius ** 2
+        return ~too_far & ~too_close & (~near_corner | corner_hit)
+
 def replay(fname):
     print("replaying", fname)
 
@@ -640,7 +1381,7 @@ def replay(fname):
 def main():
     canvas = Canvas(100, 200)
     line = Line("BLUE", (1, 1))
-    line.points.append((10, 5))
+    line.append_point((10, 5))
     print(line)
 
 
@@ -0,0 +1,34 @@
+import numpy as np
+
+from hands import Gesture
+
+# helpers shared by the test modules, pytest puts this directory on sys.path so they can import them from here
+
+FRAME_SHAPE = (480, 640, 3)
+
+
+def hand(gesture, origin, hand=0, radius=20, shift=None):
+    """One hand's metadata, every fingertip on origin (keep it right of and below the buttons)"""
+    tip = (float(origin[0]), float(origin[1]))
+    metadata = {'gesture': gesture, 'hand': hand, 'origin': origin, 'radius': radius, 'shift': shift}
+    for name in ('idx_fing_tip', 'mid_fing_tip', 'ring_fing_tip', 'pinky_fing_tip'):
+        metadata[name] = tip
+    return metadata
+
+
+def gesture(canvas, name, origin, frames=3, shift=(4, -3)):
+    """Holds a gesture at origin for frames frames, then hovers"""
+    for _ in range(frames):
+        canvas.update_state(FRAME_SHAPE, [hand(name, origin, shift=shift if name == Gesture.TRANSLATE else None)])
+    canvas.update_state(FRAME_SHAPE, [hand(Gesture.HOVER, origin)])
+
+
+def canvas_state(canvas):
+    """(lines, circles, squares) on the canvas, in a form that compares with =="""
+    lines = {line_id: (line.color, line.active, line.points.tolist()) for line_id, line in canvas.lines.items()}
+    shapes = []
+    for table in (canvas.circles, canvas.squares):
+        rows = table.take(np.sort(table.all_ids()))
+        shapes.append({shape_id: (int(rows.color_ids[i]),) + tuple(rows.columns[name][i].tolist() for name, _ in table.fields)
+                       for i, shape_id in enumerate(rows.ids.tolist())})
+    return lines, shapes[0], shapes[1]
@@ -1,7 +1,131 @@
 import cv2 as cv
 import argparse
-
-def record(fname):    
+import os
+import statistics
+import threading
+import time
+
+from canvas import Canvas
+from hands import HandDetector
+from pipeline import DropQueue, LatestSlot
+
+
+class VideoRecorder():
+    """
+    Encodes frames to a video on its own thread, so writing never holds up whoever is capturing.
+
+    write() just queues (frame, capture timestamp), at most queue_size frames are waiting at any time and past that
+    the oldest get dropped (counted in dropped). The video's fps is measured from the timestamps of the first
+    probe_frames frames instead of trusting the camera, and every frame's actual capture time (seconds since the first)
+    goes to <video name>.timestamps.csv, so the timing of a recording can be recovered exactly even if fps drifts.
+    Frames handed to write() must not be modified afterwards.
+    """
+
+    def __init__(self, fname, queue_size=64, probe_frames=30):
+        self.fname = fname
+        self.queue = DropQueue(queue_size)
+        self.probe_frames = probe_frames
+        self.fps = None
+        self.written = 0
+        self.thread = threading.Thread(target=self.write_loop, name=f'recorder {fname}', daemon=True)
+        self.thread.start()
+
+    @property
+    def dropped(self):
+        return self.queue.dropped
+
+    def write(self, frame, timestamp):
+        self.queue.put((frame, timestamp))
+
+    def write_loop(self):
+        # hold on to the first frames until there are enough timestamps to tell the frame rate
+        pending = []
+        while len(pending) < self.probe_frames:
+            item = self.queue.get()
+            if item is None:
+                break
+            pending.append(item)
+        if not pending:
+            return
+        # median frame interval, the first frames out of a camera are often late
+        intervals = [later[1] - earlier[1] for earlier, later in zip(pending, pending[1:])]
+        interval = statistics.median(intervals) if intervals else 0
+        self.fps = 1 / interval if interval > 0 else 30.0
+
+        height, width = pending[0][0].shape[:2]
+        out = cv.VideoWriter(self.fname, cv.VideoWriter_fourcc(*'mp4v'), self.fps, (width, height))
+        start = pending[0][1]
+        with open(os.path.splitext(self.fname)[0] + '.timestamps.csv', 'w') as timestamps:
+            timestamps.write('frame,seconds\n')
+            item = pending.pop(0)
+            while item is not None:
+                frame, timestamp = item
+                out.write(frame)
+                timestamps.write(f'{self.written},{timestamp - start:.6f}\n')
+                self.written += 1
+                item = pending.pop(0) if pending else self.queue.get()
+        out.release()
+
+    def close(self):
+        """Stops taking frames, waits for everything queued to be written"""
+        self.queue.close()
+        self.thread.join()
+
+
+class Annotator():
+    """
+    Runs airdraw (hands, canvas and landmarks) over frames on its own thread and hands what it draws to a recorder.
+
+    put() never blocks: past queue_size waiting frames the oldest get dropped (counted in dropped), so a slow
+    detector only thins out the annotated video, its timestamps file still says when every frame it has was taken.
+    latest holds the newest annotated frame, for the preview.
+    """
+
+    def __init__(self, recorder, frame_shape, detector_options, queue_size=4):
+        self.recorder = recorder
+        self.canvas = Canvas(frame_shape[0], frame_shape[1])
+        self.detector = HandDetector(**detector_options)
+        self.queue = DropQueue(queue_size)
+        self.latest = LatestSlot()
+        self.thread = threading.Thread(target=self.annotate_loop, name='annotator', daemon=True)
+        self.thread.start()
+
+    @property
+    def dropped(self):
+        return self.queue.dropped
+
+    def put(self, frame, timestamp):
+        """frame isn't modified, it can go to a recorder as is"""
+        self.queue.put((frame, timestamp))
+
+    def annotate_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            frame, timestamp = item
+            hands_metadata = self.detector.get_hands_metadata(frame, timestamp)
+            copy = frame.copy()
+            img = self.canvas.update_and_draw(copy, hands_metadata)
+            if img is not copy:
+                img = img.copy() # black background mode hands back a buffer it reuses
+            self.detector.draw_landmarks(img)
+            self.recorder.write(img, timestamp)
+            self.latest.put(img)
+
+    def close(self):
+        """Stops taking frames, waits for everything queued to be annotated"""
+        self.queue.close()
+        self.thread.join()
+
+
+def record(fname, annotated=None, detector_options=None):
+    """
+    Records the camera to fname. With annotated, also runs airdraw on every frame and records
+    what it shows (canvas and landmarks) there, the preview then shows that too.
+    Annotating and encoding happen on background threads (see Annotator and VideoRecorder),
+    the loop here only captures and shows.
+    """
     print("recording ", fname)
     cam = cv.VideoCapture(0)
 
@@ -9,23 +133,45 @@ def record(fname):
     frame_width = int(cam.get(cv.CAP_PROP_FRAME_WIDTH))
     frame_height = int(cam.get(cv.CAP_PROP_FRAME_HEIGHT))
 
-    fourcc = cv.VideoWriter_fourcc(*'mp4v')
-    out = cv.VideoWriter(fname, fourcc, 60.0, (frame_width, frame_height))
+    recorders = [VideoRecorder(fname)]
+    annotator = None
+    if annotated is not None:
+        recorders.append(VideoRecorder(annotated))
+        annotator = Annotator(recorders[1], (frame_height, frame_width), detector_options or {})
+    preview = None
 
     while True:
-        _, img = cam.read()
+        ret, img = cam.read()
+        timestamp = time.perf_counter()
+        if not ret:
+            break
         img = cv.flip(img, 1)
 
-        out.write(img)
-
-        cv.imshow('Recording', img)
+        recorders[0].write(img, timestamp)
+        if annotator is None:
+            preview = img
+        else:
+            # the annotator draws on its own copy, and the preview lags by however long it takes
+            annotator.put(img, timestamp)
+            latest = annotator.latest.get(timeout=0)
+            if latest is not None:
+                preview = latest
+        if preview is not None:
+            cv.imshow('Recording', preview)
 
         if cv.waitKey(1) & 0xFF == ord('q'):
             break
-    
-    out.release()
+
     cam.release()
     cv.destroyAllWindows()
+    print("finishing writing...")
+    if annotator is not None:
+        annotator.close()
+        print(f"annotator: {annotator.dropped} frames dropped before annotating")
+    for recorder in recorders:
+        recorder.close()
+        fps = f"{recorder.fps:.1f}" if recorder.fps is not None else "-"
+        print(f"{recorder.fname}: {recorder.written} frames at {fps} fps, {recorder.dropped} dropped")
     print("recording complete. shutting down.")
 
 
@@ -63,16 +209,21 @@ def main():
     )
     parser.add_argument("-m", "--mode")
     parser.add_argument("-f", "--filename")
+    parser.add_argument("-a", "--annotated", help="record: also record the airdraw output (canvas and landmarks) to this .mp4")
+    parser.add_argument("--hands", type=int, default=1, help="record with --annotated: how many hands can draw")
     args = parser.parse_args()
 
     if not args.filename.endswith(".mp4"):
         print(f"filename({args.filename}) must end with .mp4")
         return False
+    if args.annotated is not None and not args.annotated.endswith(".mp4"):
+        print(f"annotated filename({args.annotated}) must end with .mp4")
+        return False
     
     if args.mode == 'replay':
         replay(args.filename)
     elif args.mode == "record":
-        record(args.filename)
+        record(args.filename, args.annotated, {'max_hands': args.hands})
     else:
         print(f"data mode must fall into ['replay', 'record'], provided {args.mode}")
         return False
@@ -0,0 +1,93 @@
+import struct
+
+import numpy as np
+
+from hands import Gesture
+
+# A gesture log is what HandDetector.get_hands_metadata handed to Canvas.update_state every frame, so a session
+# can be rebuilt (or a canvas bug reproduced) without the video or Mediapipe, see Canvas.replay_events.
+#
+# On disk: a header (magic, version, frame rows, frame columns) followed by HAND_EVENT records, one per hand
+# per frame. A frame without hands gets a single record with hand -1, since that ends every pen's drawing too.
+# Records are fixed size, so a torn last record is dropped the same way as in store.py's session log.
+
+MAGIC = b'AIRG'
+VERSION = 1
+HEADER = struct.Struct('<4sHII')
+GESTURES = list(Gesture) # gesture codes are indices into this
+TIPS = ('idx_fing_tip', 'mid_fing_tip', 'ring_fing_tip', 'pinky_fing_tip')
+NO_HANDS = -1
+
+HAND_EVENT = np.dtype([
+    ('frame', '<u4'),
+    ('hand', '<i4'),
+    ('gesture', 'u1'),
+    ('tips', '<f8', (len(TIPS), 2)), # smoothed (r, c) fingertips, floats so button presses come out exactly the same
+    ('origin', '<i4', (2,)),
+    ('radius', '<f8'),
+    ('shift', '<i4', (2,)),
+])
+
+
+class GestureLog():
+    """Appends every frame's hands metadata to a gesture log file"""
+
+    def __init__(self, path, frame_shape):
+        self.path = path
+        self.frames = 0
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, frame_shape[0], frame_shape[1]))
+
+    def write(self, hands_metadata):
+        """hands_metadata is the list get_hands_metadata returned for one frame"""
+        events = np.zeros(max(len(hands_metadata), 1), dtype=HAND_EVENT)
+        events['frame'] = self.frames
+        if not hands_metadata:
+            events['hand'] = NO_HANDS
+        for event, hand in zip(events, hands_metadata):
+            event['hand'] = hand.get('hand', 0)
+            event['gesture'] = GESTURES.index(hand['gesture'])
+            event['tips'] = [hand[tip] for tip in TIPS]
+            if hand.get('origin') is not None:
+                event['origin'] = hand['origin']
+                event['radius'] = hand['radius']
+            if hand.get('shift') is not None:
+                event['shift'] = hand['shift']
+        self.file.write(events.tobytes())
+        self.frames += 1
+
+    def close(self):
+        self.file.close()
+
+
+def read_gesture_log(path):
+    """Returns (frame shape, HAND_EVENT array) of a gesture log"""
+    with open(path, 'rb') as f:
+        buf = f.read()
+    magic, version, rows, columns = HEADER.unpack_from(buf)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} isn't a version {VERSION} gesture log")
+    count = (len(buf) - HEADER.size) // HAND_EVENT.itemsize
+    events = np.frombuffer(buf, dtype=HAND_EVENT, count=count, offset=HEADER.size)
+    return (rows, columns, 3), events
+
+
+def event_metadata(event):
+    """The metadata dict update_state gets for one hand, rebuilt from its HAND_EVENT record"""
+    gesture = GESTURES[event['gesture']]
+    metadata = {'gesture': gesture, 'hand': int(event['hand']), 'origin': None, 'radius': None, 'shift': None}
+    for tip, (r, c) in zip(TIPS, event['tips'].tolist()):
+        metadata[tip] = (r, c)
+    if gesture != Gesture.HOVER:
+        metadata['origin'] = tuple(event['origin'].tolist())
+        metadata['radius'] = float(event['radius'])
+    if gesture == Gesture.TRANSLATE:
+        metadata['shift'] = tuple(event['shift'].tolist())
+    return metadata
+
+
+def frame_metadata(events):
+    """What update_state got for one frame, given that frame's records"""
+    if events[0]['hand'] == NO_HANDS:
+        return []
+    return [event_metadata(event) for event in events]
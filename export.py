@@ -0,0 +1,224 @@
+import argparse
+import os
+import struct
+import zlib
+
+import cv2 as cv
+import numpy as np
+
+from canvas import Canvas, CIRCLE_THICKNESS, LINE_THICKNESS, SQUARE_THICKNESS
+from store import SessionStore, read_canvas_size
+
+# fixed point bits handed to opencv so scaled coordinates keep their fractional part
+SHIFT_BITS = 4
+SHIFT_SCALE = 1 << SHIFT_BITS
+
+
+def png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+class PNGStreamWriter():
+    """
+    Minimal PNG encoder that takes the image a band of rows at a time, so the whole image never has to be in memory.
+    Rows come in as (rows, width, channels) uint8 in RGB/RGBA order.
+    """
+
+    def __init__(self, f, width, height, channels):
+        self.f = f
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.compressor = zlib.compressobj(6)
+        color_type = {3: 2, 4: 6}[channels]
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0)))
+
+    def write_rows(self, rows):
+        # every scanline starts with its filter type, 0 = none
+        scanlines = np.empty((len(rows), 1 + self.width * self.channels), dtype=np.uint8)
+        scanlines[:, 0] = 0
+        scanlines[:, 1:] = rows.reshape(len(rows), -1)
+        data = self.compressor.compress(scanlines.tobytes())
+        if data:
+            self.f.write(png_chunk(b'IDAT', data))
+
+    def close(self):
+        self.f.write(png_chunk(b'IDAT', self.compressor.flush()))
+        self.f.write(png_chunk(b'IEND', b''))
+
+
+def line_bounds(canvas):
+    """(lines, top, left, bottom, right) of every line on the canvas, bounds as arrays"""
+    lines = list(canvas.lines.values())
+    if not lines:
+        empty = np.empty(0, dtype=np.int64)
+        return lines, empty, empty, empty, empty
+    lows = np.array([line.points.min(axis=0) for line in lines])
+    highs = np.array([line.points.max(axis=0) for line in lines])
+    return lines, lows[:, 0], lows[:, 1], highs[:, 0], highs[:, 1]
+
+
+def render_band(canvas, scale, top, band, mask, bounds):
+    """
+    Draws every shape overlapping the band (rows [top, top + len(band)) of the scaled image) into band and mask.
+    bounds is the output of line_bounds, used to skip lines outside the band.
+    """
+    height = len(band)
+    lines, line_top, _, line_bottom, _ = bounds
+
+    def fixed(points):
+        # (r, c) canvas coordinates -> (x, y) fixed point band coordinates
+        scaled = np.rint((np.asarray(points, dtype=np.float64) * scale - (top, 0)) * SHIFT_SCALE).astype(np.int32)
+        return np.ascontiguousarray(scaled[..., ::-1])
+
+    # margin so thick strokes just outside the band still get their edge drawn
+    margin = max(LINE_THICKNESS, SQUARE_THICKNESS) * scale
+    visible = np.nonzero((line_bottom * scale + margin >= top) & (line_top * scale - margin < top + height))[0]
+    thickness = max(1, int(round(LINE_THICKNESS * scale)))
+    for i in visible.tolist():
+        line = lines[i]
+        if line.size < 2:
+            continue
+        points = fixed(line.points)
+        cv.polylines(band, [points], False, line.color.value, thickness, cv.LINE_AA, SHIFT_BITS)
+        cv.polylines(mask, [points], False, 255, thickness, cv.LINE_AA, SHIFT_BITS)
+
+    thickness = max(1, int(round(CIRCLE_THICKNESS * scale)))
+    for circle in canvas.circles:
+        center = tuple(fixed(circle.origin).tolist())
+        radius = int(round(circle.radius * scale * SHIFT_SCALE))
+        if (circle.origin[0] + circle.radius) * scale + thickness < top or (circle.origin[0] - circle.radius) * scale - thickness >= top + height:
+            continue
+        cv.circle(band, center, radius, circle.color.value, thickness, cv.LINE_AA, SHIFT_BITS)
+        cv.circle(mask, center, radius, 255, thickness, cv.LINE_AA, SHIFT_BITS)
+
+    thickness = max(1, int(round(SQUARE_THICKNESS * scale)))
+    for square in canvas.squares:
+        topRow, leftCol, bottomRow, rightCol = square.get_coords()
+        if bottomRow * scale + thickness < top or topRow * scale - thickness >= top + height:
+            continue
+        corners = fixed([(topRow, leftCol), (topRow, rightCol), (bottomRow, rightCol), (bottomRow, leftCol)])
+        cv.polylines(band, [corners], True, square.color.value, thickness, cv.LINE_AA, SHIFT_BITS)
+        cv.polylines(mask, [corners], True, 255, thickness, cv.LINE_AA, SHIFT_BITS)
+
+
+def export_png(canvas, path, scale=1.0, background=(0, 0, 0), band_rows=256):
+    """
+    Renders the canvas to a PNG of (rows * scale) x (columns * scale) pixels.
+
+    background is a BGR color, or None for a transparent PNG.
+    The image is rendered and compressed band_rows rows at a time, so memory stays bounded by the band size
+    no matter how big the export is.
+    """
+    height = max(1, int(round(canvas.rows * scale)))
+    width = max(1, int(round(canvas.columns * scale)))
+    channels = 3 if background is not None else 4
+    bounds = line_bounds(canvas)
+
+    band = np.empty((band_rows, width, 3), dtype=np.uint8)
+    mask = np.empty((band_rows, width), dtype=np.uint8)
+    out = np.empty((band_rows, width, channels), dtype=np.uint8)
+    with open(path, 'wb') as f:
+        writer = PNGStreamWriter(f, width, height, channels)
+        for top in range(0, height, band_rows):
+            rows = min(band_rows, height - top)
+            band_view, mask_view, out_view = band[:rows], mask[:rows], out[:rows]
+            band_view[:] = background if background is not None else 0
+            mask_view[:] = 0
+            render_band(canvas, scale, top, band_view, mask_view, bounds)
+            # BGR -> RGB(A) for the file
+            out_view[..., :3] = band_view[..., ::-1]
+            if channels == 4:
+                out_view[..., 3] = mask_view
+            writer.write_rows(out_view)
+        writer.close()
+
+
+def svg_color(color):
+    blue, green, red = color.value
+    return f'rgb({red},{green},{blue})'
+
+
+def export_svg(canvas, path, scale=1.0, background=(0, 0, 0)):
+    """
+    Writes the canvas as an SVG: one path per stroke, plus circle and rect elements.
+    Shapes are streamed out one by one, nothing gets rasterized.
+    """
+    height = canvas.rows * scale
+    width = canvas.columns * scale
+    with open(path, 'w') as f:
+        f.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:g}" height="{height:g}" '
+                f'viewBox="0 0 {canvas.columns} {canvas.rows}">\n')
+        if background is not None:
+            blue, green, red = background
+            f.write(f'<rect width="100%" height="100%" fill="rgb({red},{green},{blue})"/>\n')
+
+        f.write(f'<g fill="none" stroke-linecap="round" stroke-linejoin="round" stroke-width="{LINE_THICKNESS}">\n')
+        for line in canvas.lines.values():
+            if line.size < 2:
+                continue
+            coords = ' '.join(f'{c},{r}' for r, c in line.points.tolist())
+            f.write(f'<path stroke="{svg_color(line.color)}" d="M{coords.replace(" ", " L", 1)}"/>\n')
+        for circle in canvas.circles:
+            r, c = circle.origin
+            f.write(f'<circle stroke="{svg_color(circle.color)}" stroke-width="{CIRCLE_THICKNESS}" '
+                    f'cx="{c}" cy="{r}" r="{circle.radius}"/>\n')
+        for square in canvas.squares:
+            topRow, leftCol, bottomRow, rightCol = square.get_coords()
+            f.write(f'<rect stroke="{svg_color(square.color)}" stroke-width="{SQUARE_THICKNESS}" stroke-linejoin="miter" '
+                    f'x="{leftCol}" y="{topRow}" width="{rightCol - leftCol}" height="{bottomRow - topRow}"/>\n')
+        f.write('</g>\n</svg>\n')
+
+
+def open_session(directory):
+    """Loads a saved session into a new Canvas, sized like the one that saved it"""
+    size = read_canvas_size(directory)
+    if size is None:
+        # log only session, size the canvas to its content
+        canvas = Canvas(1 << 16, 1 << 16)
+        SessionStore(directory).load(canvas)
+        bottom, right = 1, 1
+        for line in canvas.lines.values():
+            bottom, right = max(bottom, int(line.points[:, 0].max()) + 1), max(right, int(line.points[:, 1].max()) + 1)
+        for square in canvas.squares:
+            _, _, bottomRow, rightCol = square.get_coords()
+            bottom, right = max(bottom, bottomRow + 1), max(right, rightCol + 1)
+        for circle in canvas.circles:
+            bottom = max(bottom, circle.origin[0] + circle.radius + 1)
+            right = max(right, circle.origin[1] + circle.radius + 1)
+        canvas.rows, canvas.columns = bottom, right
+        return canvas
+
+    canvas = Canvas(*size)
+    SessionStore(directory).load(canvas)
+    return canvas
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='export.py',
+        description='render saved airdraw sessions to PNG or SVG, no camera or display needed'
+    )
+    parser.add_argument("sessions", nargs='+', help="session directories (see airdraw.py --session)")
+    parser.add_argument("-o", "--output", default=".", help="directory to write the exports to")
+    parser.add_argument("-f", "--format", choices=['png', 'svg'], default='png')
+    parser.add_argument("--scale", type=float, default=1.0, help="output size relative to the canvas")
+    parser.add_argument("--transparent", action='store_true', help="transparent background instead of black")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    background = None if args.transparent else (0, 0, 0)
+    for session in args.sessions:
+        canvas = open_session(session)
+        name = os.path.basename(os.path.normpath(session))
+        path = os.path.join(args.output, f"{name}.{args.format}")
+        if args.format == 'png':
+            export_png(canvas, path, args.scale, background)
+        else:
+            export_svg(canvas, path, args.scale, background)
+        print("exported", session, "->", path)
+
+
+if __name__ == "__main__":
+    main()
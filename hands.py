@@ -1,10 +1,28 @@
+import math
+import time
+
 import cv2 as cv
-import mediapipe as mp
 import numpy as np
+try:
+    import mediapipe as mp
+except ImportError: # only needed to actually detect hands, replaying traces and benchmarks work without it
+    mp = None
 from enum import Enum
-from collections import deque
 
+from timing import NULL_TIMER
 from util import xy_euclidean_dist, vectorize, cos_angle
+
+# same topology as mp.solutions.hands.HAND_CONNECTIONS, as (start, end) landmark indices
+HAND_CONNECTIONS = np.array([
+    (0, 1), (1, 2), (2, 3), (3, 4), # thumb
+    (0, 5), (5, 6), (6, 7), (7, 8), # index
+    (5, 9), (9, 10), (10, 11), (11, 12), # middle
+    (9, 13), (13, 14), (14, 15), (15, 16), # ring
+    (13, 17), (0, 17), (17, 18), (18, 19), (19, 20), # pinky and palm
+])
+CONNECTION_COLOR = (224, 224, 224)
+LANDMARK_COLOR = (0, 0, 255)
+
 class Gesture(Enum):
     DRAW = 'DRAW'
     HOVER = 'HOVER'
@@ -12,43 +30,180 @@ class Gesture(Enum):
     TRANSLATE = 'TRANSLATE'
 
 class LandmarkBuffer():
-    """Helper RingBuffer class to abstract away averaging logic"""
+    """
+    Helper RingBuffer class to abstract away averaging logic.
 
-    def __init__(self, max_size):
-        self.buf = deque([], maxlen=max_size)
+    Landmarks live in a preallocated (max_size, 21, 3) array next to a running sum of everything in it,
+    so pushing, averaging and taking the displacement are all O(1) and allocate nothing.
+    The arrays handed back are reused on the next call, copy them if you need to keep them around.
+    """
 
-    def push_landmark(self, element):
-        self.buf.append(element)
+    def __init__(self, max_size, num_landmarks=21):
+        self.max_size = max_size
+        self.buf = np.zeros((max_size, num_landmarks, 3), dtype=np.float64)
+        self.sum = np.zeros((num_landmarks, 3), dtype=np.float64)
+        self.head = 0 # slot the next landmark goes in
+        self.count = 0
+        self.average = np.zeros((num_landmarks, 3), dtype=np.float64)
+        self.residual = np.zeros((num_landmarks, 3), dtype=np.float64)
+
+    def __len__(self):
+        return self.count
+
+    def push_landmark(self, element, timestamp=None):
+        slot = self.buf[self.head]
+        if self.count == self.max_size:
+            self.sum -= slot
+        else:
+            self.count += 1
+        slot[:] = element
+        self.sum += slot
+        self.head = (self.head + 1) % self.max_size
+        if self.head == 0 and self.count == self.max_size:
+            # resync once per lap so float error in the running sum can't build up
+            np.sum(self.buf, axis=0, out=self.sum)
+
+    def latest(self, age=0):
+        """Landmark pushed age pushes ago (0 is the newest)"""
+        return self.buf[(self.head - 1 - age) % self.max_size]
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+        self.sum.fill(0)
     
     def average_landmarks(self):
-        assert(len(self.buf) > 0)
-        res = [[0]*3 for i in range(21)]
-        num_points = len(self.buf)
-        
-        for landmark in self.buf:
-            for i, vec in enumerate(landmark):
-                res[i][0] += vec[0]
-                res[i][1] += vec[1]
-                res[i][2] += vec[2]
-        
-        for i, vec in enumerate(res):
-            res[i][0] /= num_points
-            res[i][1] /= num_points
-            res[i][2] /= num_points
+        assert(self.count > 0)
+        np.divide(self.sum, self.count, out=self.average)
+        return self.average
 
-        return res
+    def smoothed_landmarks(self):
+        """Smoother interface, shared with OneEuroFilter"""
+        return self.average_landmarks()
 
     def displacement(self):
         """Calculates the residual from the last two landmarks"""
-        res = [[0]*3 for i in range(21)]
-        num_points = len(self.buf)
-        if num_points < 2 or any([len(landmark) != 21 for landmark in self.buf]):
-            return res
-        
-        for i in range(21):
-            for j in range(3):
-                res[i][j] = self.buf[-1][i][j] - self.buf[-2][i][j]
-        return res
+        if self.count < 2:
+            self.residual.fill(0)
+        else:
+            np.subtract(self.latest(0), self.latest(1), out=self.residual)
+        return self.residual
+
+class OneEuroFilter():
+    """
+    One Euro filter (Casiez et al.) over every landmark coordinate at once, a drop in for LandmarkBuffer as the smoother.
+
+    Each coordinate gets low pass filtered with a cutoff that rises with how fast it's moving: slow hands get
+    min_cutoff (Hz, lower = less jitter), fast ones get min_cutoff + beta * speed (higher beta = less lag).
+    d_cutoff is the cutoff used on the speed estimate itself. Timestamps are in seconds, pushes without one
+    are assumed to be 1 / rate apart. All state is fixed size, so a push costs the same no matter how long it runs.
+    """
+
+    def __init__(self, min_cutoff=1.0, beta=0.01, d_cutoff=1.0, rate=30.0, num_landmarks=21):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.rate = rate
+        self.count = 0
+        self.last_timestamp = None
+        shape = (num_landmarks, 3)
+        self.value = np.zeros(shape, dtype=np.float64) # filtered landmarks
+        self.previous = np.zeros(shape, dtype=np.float64) # filtered landmarks one push ago
+        self.speed = np.zeros(shape, dtype=np.float64) # filtered derivative, per second
+        self.alpha = np.zeros(shape, dtype=np.float64)
+        self.scratch = np.zeros(shape, dtype=np.float64)
+        self.residual = np.zeros(shape, dtype=np.float64)
+
+    def __len__(self):
+        return self.count
+
+    @staticmethod
+    def smoothing_factor(cutoff, dt):
+        # alpha = 1 / (1 + tau / dt) with tau = 1 / (2 pi cutoff)
+        return 1.0 / (1.0 + 1.0 / (2 * math.pi * cutoff * dt))
+
+    def push_landmark(self, element, timestamp=None):
+        if self.count == 0:
+            self.value[:] = element
+            self.previous[:] = self.value
+            self.speed.fill(0)
+            self.count = 1
+            self.last_timestamp = timestamp
+            return
+
+        dt = 1.0 / self.rate
+        if timestamp is not None and self.last_timestamp is not None and timestamp > self.last_timestamp:
+            dt = timestamp - self.last_timestamp
+        self.last_timestamp = timestamp
+        self.previous[:] = self.value
+
+        # speed estimate: low pass of (x - previous) / dt
+        scratch = self.scratch
+        np.subtract(element, self.value, out=scratch)
+        scratch /= dt
+        scratch -= self.speed
+        scratch *= self.smoothing_factor(self.d_cutoff, dt)
+        self.speed += scratch
+
+        # per coordinate cutoff from the speed, then the low pass itself
+        np.abs(self.speed, out=self.alpha)
+        self.alpha *= self.beta
+        self.alpha += self.min_cutoff
+        self.alpha *= 2 * math.pi * dt
+        np.divide(self.alpha, self.alpha + 1.0, out=self.alpha) # same as smoothing_factor, vectorized
+        np.subtract(element, self.value, out=scratch)
+        scratch *= self.alpha
+        self.value += scratch
+        self.count += 1
+
+    def clear(self):
+        self.count = 0
+        self.last_timestamp = None
+
+    def smoothed_landmarks(self):
+        assert(self.count > 0)
+        return self.value
+
+    def displacement(self):
+        """How far the filtered landmarks moved with the last push"""
+        if self.count < 2:
+            self.residual.fill(0)
+        else:
+            np.subtract(self.value, self.previous, out=self.residual)
+        return self.residual
+
+class HandTrack():
+    """
+    One hand followed across frames: its own smoother, and the last two detections its landmarks get
+    extrapolated from on frames where detection is skipped (constant velocity).
+    """
+
+    def __init__(self, hand_id, handedness, smoother):
+        self.id = hand_id
+        self.handedness = handedness # 'Left'/'Right' as Mediapipe reports it, None if unknown
+        self.smoother = smoother
+        self.detections = LandmarkBuffer(2) # raw landmarks of the last two detections
+        self.velocity = np.zeros((21, 3), dtype=np.float64) # per frame
+        self.predicted = np.zeros((21, 3), dtype=np.float64)
+        self.landmarks = None # landmarks used for the latest frame
+
+    def observe(self, landmarks, frames):
+        """Takes a detection made frames frames after the previous one"""
+        self.detections.push_landmark(landmarks)
+        if len(self.detections) > 1:
+            np.divide(self.detections.displacement(), frames, out=self.velocity)
+        self.landmarks = self.detections.latest()
+
+    def predict(self, frames):
+        """Extrapolates landmarks frames frames past the last detection"""
+        # idx column has 0 velocity so it stays put
+        np.multiply(self.velocity, frames, out=self.predicted)
+        self.predicted += self.detections.latest()
+        self.landmarks = self.predicted
+
+    def expected_center(self, frames):
+        """Where the middle of the hand should be frames frames after the last detection, (x, y)"""
+        return self.detections.latest()[:, 1:].mean(axis=0) + self.velocity[:, 1:].mean(axis=0) * frames
 
 class HandDetector():
     """
@@ -56,19 +211,110 @@ class HandDetector():
 
     This class will define how Airdraw will be passing information to and receiving information from Mediapipe. 
     Successful implementation of this class should involve no image rendering, but rather just state transformation of hands, gestures, and other metadata used from Mediapipe.
+
+    Up to max_hands hands are followed at once, each as a HandTrack with its own smoother and an id that sticks
+    to it across frames (hands get matched to the ones from before by handedness and position).
+
+    Tracking mode (track_roi=True) only sends Mediapipe a crop around where the hands were last frame, grown by
+    roi_margin times the hand's size on each side, and falls back to the full frame once every hand is lost.
+    With several hands the crop covers all of them, so a new hand is only picked up after a full frame search.
+    inference_size caps the longest side of whatever gets sent to Mediapipe (downscaling it), None sends it as is.
+    Together these make inference cost depend on the size of the hand rather than the camera resolution.
+
+    detect_every only runs Mediapipe on every Nth frame, frames in between get landmarks predicted by a constant
+    velocity model over the last two detections. 'auto' picks N from the measured inference time so that
+    inference fits in frame_budget seconds per frame on average, up to max_detect_every.
+
+    smoothing picks what steadies the landmarks: 'average' is a moving average over smoothing_window frames,
+    'one_euro' is a OneEuroFilter built from one_euro_options (min_cutoff, beta, d_cutoff), which lags a lot less.
     """
 
-    def __init__(self, mode = False, max_hands = 1):
+    def __init__(self, mode = False, max_hands = 1, smoothing_window = 5, track_roi = False, roi_margin = 0.5,
+                 inference_size = None, detect_every = 1, frame_budget = 1 / 30, max_detect_every = 4,
+                 smoothing = 'average', one_euro_options = None, timer = None):
         # setup
         self.max_hands = max_hands
         self.mode = mode
+        self.track_roi = track_roi
+        self.roi_margin = roi_margin
+        self.inference_size = inference_size
+        self.roi = None # (left, top, right, bottom) in pixels, None means search the full frame
         # hand drawing stuff
-        self.hands = mp.solutions.hands.Hands(self.mode, self.max_hands)
-        self.drawing = mp.solutions.drawing_utils
-        self.hand_connections = mp.solutions.hands.HAND_CONNECTIONS
+        self.hands = None # Mediapipe instance, made the first time it's needed
+        self.hand_connections = HAND_CONNECTIONS
+        # per frame buffers, reused so the work around inference allocates (almost) nothing
+        self.image_buffer = np.empty(0, dtype=np.uint8) # backs the resized and RGB images handed to Mediapipe
+        self.hand_landmarks = np.zeros((max_hands, 21, 3), dtype=np.float64) # (idx, x, y) in pixels, per detected hand
+        self.hand_landmarks[:, :, 0] = np.arange(21)
+        self.no_landmarks = np.zeros((0, 3), dtype=np.float64)
+        self.frame_landmarks = [] # landmarks used for the latest frame, one array per hand, what draw_landmarks draws
+        self.skeleton = np.zeros((len(HAND_CONNECTIONS), 2, 2), dtype=np.int32)
         # will be used for translation
-        self.translation_buffer = LandmarkBuffer(5)
-        # we have 0 velocity to start translation
+        if smoothing not in ('average', 'one_euro'):
+            raise ValueError(f"unknown smoothing {smoothing!r}, expected 'average' or 'one_euro'")
+        self.smoothing = smoothing
+        self.smoothing_window = smoothing_window
+        self.one_euro_options = one_euro_options if one_euro_options is not None else {}
+        # hands being followed, in the order Mediapipe reported them
+        self.tracks = []
+        self.next_hand_id = 0
+        # frame skipping
+        self.detect_every = detect_every
+        self.frame_budget = frame_budget
+        self.max_detect_every = max_detect_every
+        self.frames_since_detection = 0
+        self.inference_time = None # moving average of seconds per detection
+        # per stage latencies (timing.StageTimer), nothing gets recorded by default
+        self.timer = timer if timer is not None else NULL_TIMER
+
+    def reset(self):
+        """
+        Forgets everything carried over from earlier frames: the ROI, the tracks, frame skipping and Mediapipe's own
+        tracking (its instance gets remade). The next frame is handled like the first frame of a new video.
+        """
+        self.roi = None
+        self.tracks = []
+        self.next_hand_id = 0
+        self.frames_since_detection = 0
+        self.inference_time = None
+        self.frame_landmarks = []
+        if self.hands is not None:
+            self.hands.close()
+            self.hands = None
+
+    def make_smoother(self):
+        if self.smoothing == 'one_euro':
+            return OneEuroFilter(**self.one_euro_options)
+        return LandmarkBuffer(self.smoothing_window)
+
+    def detect_hands(self, frame):
+        """
+        Runs Mediapipe on the frame.
+
+        returns:
+            - list of ((21, 3) array of (idx, x, y) landmarks in pixels, handedness) per hand found.
+              The arrays are reused on the next call.
+        """
+        height, width, _ = frame.shape
+        self.results, region = self.process_region(frame, self.roi if self.track_roi else None)
+        if self.roi is not None and not self.results.multi_hand_landmarks:
+            # lost the hands, look for them everywhere again right away
+            self.roi = None
+            self.results, region = self.process_region(frame, None)
+
+        hands = []
+        if self.results.multi_hand_landmarks:
+            handedness = self.results.multi_handedness or []
+            for i, hand in enumerate(self.results.multi_hand_landmarks[:self.max_hands]):
+                landmarks = self.hand_landmarks[i]
+                self.to_pixels(hand, region, landmarks)
+                label = handedness[i].classification[0].label if i < len(handedness) else None
+                hands.append((landmarks, label))
+
+        if self.track_roi:
+            self.roi = self.roi_around(self.hand_landmarks[:len(hands)].reshape(-1, 3), width, height) if hands else None
+        self.frame_landmarks = [landmarks for landmarks, _ in hands]
+        return hands
 
     def detect_landmarks(self, frame):
         """
@@ -77,28 +323,154 @@ class HandDetector():
         args:
             - frame: np array representing image input. used to resize the prediction against mediapipe (will just use the builtin api soon though).
        returns:
-            - list of landmarks on the hand in order of size and position
+            - (21, 3) array of (idx, x, y) landmarks in pixels of the first hand, or an empty (0, 3) one if there's no hand.
+              The array is reused on the next call.
         """
-        img_rgb = cv.cvtColor(frame, cv.COLOR_BGR2RGB) # I think we need RGB
-        self.results = self.hands.process(img_rgb)
+        hands = self.detect_hands(frame)
+        return hands[0][0] if hands else self.no_landmarks
 
-        landmarks = []
-        if self.results.multi_hand_landmarks:
-            my_hand = self.results.multi_hand_landmarks[0] # should only be one
-            for idx, landmark in enumerate(my_hand.landmark):
-                height, width, _ = frame.shape
-                x, y = int(landmark.x * width), int(landmark.y * height)
-                landmarks.append((idx, x, y))
-
-        return landmarks
+    @staticmethod
+    def to_pixels(hand_landmarks, region, out):
+        """
+        Writes one Mediapipe hand into the x, y columns of a (21, 3) array, in full frame pixels.
+        region is the (left, top, width, height) of the frame Mediapipe saw.
+        """
+        left, top, region_width, region_height = region
+        coords = out[:, 1:]
+        coords[:] = np.fromiter((value for landmark in hand_landmarks.landmark for value in (landmark.x, landmark.y)),
+                                dtype=np.float64, count=2 * len(out)).reshape(-1, 2)
+        coords *= (region_width, region_height)
+        coords += (left, top)
+        np.trunc(coords, out=coords) # whole pixels, like int() did
+
+    def current_detect_every(self):
+        """How many frames one detection has to cover right now"""
+        if self.detect_every != 'auto':
+            return self.detect_every
+        if self.inference_time is None:
+            return 1
+        return max(1, min(self.max_detect_every, math.ceil(self.inference_time / self.frame_budget)))
+
+    def track_hands(self, frame):
+        """
+        Brings every track up to this frame: detected if it's a detection frame (or there's nothing to predict from),
+        otherwise extrapolated from the last detection. Returns the tracks, each with .landmarks set for this frame.
+        """
+        self.frames_since_detection += 1
+        if self.tracks and self.frames_since_detection < self.current_detect_every():
+            for track in self.tracks:
+                track.predict(self.frames_since_detection)
+            self.frame_landmarks = [track.landmarks for track in self.tracks]
+            return self.tracks
+
+        start = time.perf_counter()
+        hands = self.detect_hands(frame)
+        elapsed = time.perf_counter() - start
+        self.inference_time = elapsed if self.inference_time is None else 0.9 * self.inference_time + 0.1 * elapsed
+
+        self.match_tracks(hands, self.frames_since_detection)
+        self.frames_since_detection = 0
+        return self.tracks
+
+    def match_tracks(self, hands, frames):
+        """
+        Pairs the hands just detected with the tracks from before, closest pairs first and never across handedness.
+        Hands left over start new tracks, tracks left over are dropped (nothing to extrapolate from).
+        """
+        pairs = []
+        for i, (landmarks, label) in enumerate(hands):
+            center = landmarks[:, 1:].mean(axis=0)
+            for j, track in enumerate(self.tracks):
+                if label is not None and track.handedness is not None and label != track.handedness:
+                    continue
+                offset = center - track.expected_center(frames)
+                pairs.append((math.hypot(offset[0], offset[1]), i, j))
+        pairs.sort()
+
+        matches = {}
+        taken = set()
+        for _, i, j in pairs:
+            if i in matches or j in taken:
+                continue
+            matches[i] = j
+            taken.add(j)
+
+        tracks = []
+        for i, (landmarks, label) in enumerate(hands):
+            if i in matches:
+                track = self.tracks[matches[i]]
+            else:
+                track = HandTrack(self.next_hand_id, label, self.make_smoother())
+                self.next_hand_id += 1
+            track.observe(landmarks, frames)
+            tracks.append(track)
+        self.tracks = tracks
+
+    def process_region(self, frame, roi):
+        """
+        Runs Mediapipe on the roi (left, top, right, bottom) of frame, or all of it if roi is None,
+        downscaled to inference_size. Returns the results and the (left, top, width, height) region they're relative to.
+        """
+        start = self.timer.start()
+        height, width, _ = frame.shape
+        left, top, right, bottom = roi if roi is not None else (0, 0, width, height)
+        crop = frame[top:bottom, left:right]
+
+        crop_height, crop_width = crop.shape[:2]
+        if self.inference_size is not None and max(crop_height, crop_width) > self.inference_size:
+            scale = self.inference_size / max(crop_height, crop_width)
+            size = (max(1, int(crop_width * scale)), max(1, int(crop_height * scale)))
+            # resized image goes in the back half of the buffer, RGB one in the front
+            resized = self.image_view((size[1], size[0], 3), offset=size[0] * size[1] * 3)
+            crop = cv.resize(crop, size, dst=resized, interpolation=cv.INTER_AREA)
+
+        img_rgb = cv.cvtColor(crop, cv.COLOR_BGR2RGB, dst=self.image_view(crop.shape)) # I think we need RGB
+        self.timer.stop('cvtColor', start) # resize included
+        if self.hands is None:
+            if mp is None:
+                raise ImportError("mediapipe is needed for hand detection, pip install mediapipe")
+            self.hands = mp.solutions.hands.Hands(self.mode, self.max_hands)
+        start = self.timer.start()
+        results = self.hands.process(img_rgb)
+        self.timer.stop('mediapipe', start)
+        return results, (left, top, crop_width, crop_height)
+
+    def image_view(self, shape, offset=0):
+        """Contiguous uint8 array of shape backed by image_buffer (from offset), which grows if it has to"""
+        size = shape[0] * shape[1] * shape[2]
+        if len(self.image_buffer) < 2 * size:
+            # room for both the resized and the RGB image of this size
+            self.image_buffer = np.empty(2 * size, dtype=np.uint8)
+        return self.image_buffer[offset:offset + size].reshape(shape)
+
+    def roi_around(self, landmarks, width, height):
+        """Square box around the landmarks, grown by roi_margin of the hand size on each side, clamped to the frame"""
+        (_, min_x, min_y), (_, max_x, max_y) = landmarks.min(axis=0), landmarks.max(axis=0)
+        center_x, center_y = (min_x + max_x) / 2, (min_y + max_y) / 2
+        # hands rotate, so use the longest side for both and never go below something Mediapipe can work with
+        half_size = max(max_x - min_x, max_y - min_y, 32) * (0.5 + self.roi_margin)
+        left, right = int(max(center_x - half_size, 0)), int(min(center_x + half_size, width))
+        top, bottom = int(max(center_y - half_size, 0)), int(min(center_y + half_size, height))
+        if right - left < 2 or bottom - top < 2:
+            return None
+        return (left, top, right, bottom)
     
-    def draw_landmarks(self, img):
+    def draw_landmarks(self, img, landmarks=None):
         """
         Draws hand landmarks on image. Breaks rules of class being only "img"->hand current state, but I think this looks the best so I'm keeping it this way.
+        landmarks is one (21, 3) array or a list of them, defaults to the ones used for the latest frame (detected or predicted).
+        Each skeleton is one polylines call over every connection plus a circle per joint.
         """
-        if self.results.multi_hand_landmarks:
-           for hand_landmark in self.results.multi_hand_landmarks:
-               self.drawing.draw_landmarks(img, hand_landmark, mp.solutions.hands.HAND_CONNECTIONS)
+        if landmarks is None:
+            landmarks = self.frame_landmarks
+        if isinstance(landmarks, np.ndarray):
+            landmarks = [landmarks] if len(landmarks) else []
+        for hand in landmarks:
+            points = hand[:, 1:].astype(np.int32)
+            np.take(points, self.hand_connections, axis=0, out=self.skeleton)
+            cv.polylines(img, self.skeleton, False, CONNECTION_COLOR, 2)
+            for x, y in points.tolist():
+                cv.circle(img, (x, y), 3, LANDMARK_COLOR, -1)
 
    
     def detect_gesture(self, landmarks, threshhold=0.70, debug=False):
@@ -164,21 +536,59 @@ class HandDetector():
         # otherwise hover
         return Gesture.HOVER
     
-    def get_gesture_metadata(self, frame):
+    def get_gesture_metadata(self, frame, timestamp=None):
         """
         Calls MP on frame and returns metadata about gesture determined.
         Args: 
             - frame: np array defining our image.
+            - timestamp: capture time of the frame in seconds, defaults to now. Used by the smoother.
         Returns: 
-            - returns a dict defining gesture as well as metadata to draw output with.
+            - returns a dict defining gesture as well as metadata to draw output with, for the first hand ({} if none).
         """
+        hands = self.get_hands_metadata(frame, timestamp)
+        return hands[0] if hands else {}
 
-        landmark_list = self.detect_landmarks(frame)
-        if len(landmark_list) == 0 or np.sum(landmark_list) == 0:
-            return {}
-        
-        self.translation_buffer.push_landmark(landmark_list)
-        average_landmark_list = self.translation_buffer.average_landmarks()
+    def get_hands_metadata(self, frame, timestamp=None):
+        """
+        Same as get_gesture_metadata, but for every hand: returns a list of metadata dicts, each with
+        the 'hand' id of its track and its 'handedness' added.
+        """
+        return self.tracks_metadata(self.track_hands(frame), timestamp)
+
+    def hands_metadata_from_landmarks(self, hands, timestamp=None):
+        """
+        get_hands_metadata for hands detected elsewhere (another process, a cache, ...): hands is what detect_hands
+        returns for one frame, a list of ((21, 3) landmarks, handedness). Nothing gets sent to Mediapipe.
+        """
+        self.match_tracks(hands, 1)
+        self.frame_landmarks = [track.landmarks for track in self.tracks]
+        return self.tracks_metadata(self.tracks, timestamp)
+
+    def tracks_metadata(self, tracks, timestamp=None):
+        """Pushes this frame's landmarks of every track through its smoother, returns their metadata dicts"""
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        hands = []
+        for track in tracks:
+            if np.sum(track.landmarks) == 0:
+                continue
+            start = self.timer.start()
+            track.smoother.push_landmark(track.landmarks, timestamp)
+            smoothed = track.smoother.smoothed_landmarks()
+            displacement = track.smoother.displacement()
+            self.timer.stop('smoothing', start)
+            start = self.timer.start()
+            post = self.gesture_metadata(smoothed, displacement)
+            self.timer.stop('gesture', start)
+            post['hand'] = track.id
+            post['handedness'] = track.handedness
+            hands.append(post)
+        return hands
+
+    def gesture_metadata(self, average_landmark_list, displacement):
+        """
+        Metadata dict for one hand given its smoothed landmarks and how far they moved since last frame.
+        """
         gesture = self.detect_gesture(average_landmark_list)
 
         # only extract the row, col before sending it literally anywhere else
@@ -239,8 +649,6 @@ class HandDetector():
             post['radius'] = distance * 0.5
 
             # Calculate and store the shift
-            displacement = self.translation_buffer.displacement()
-
             index_displacement = displacement[8]
             _, index_c_displacement, index_r_displacement = index_displacement
 
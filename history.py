@@ -0,0 +1,128 @@
+from collections import deque
+from enum import Enum
+
+
+class Op(Enum):
+    ADD = 'ADD'
+    REMOVE = 'REMOVE'
+    SHIFT = 'SHIFT'
+
+
+def target_ids(shapes):
+    """Ids of the shapes in one field of a delta, Lines carry .id and shape rows carry an ids array"""
+    ids = getattr(shapes, 'ids', None)
+    if ids is not None:
+        return set(ids.tolist())
+    return {shape.id for shape in shapes}
+
+
+class Delta():
+    """
+    One reversible change to the canvas.
+
+    Deltas hold references to the Line objects they touched and the (few) table rows of the circles
+    and squares they touched, never copies of the canvas, plus the (dr, dc) shift for SHIFT deltas.
+    """
+
+    def __init__(self, op: Op, lines=(), circles=(), squares=(), shift=(0, 0)):
+        self.op = op
+        self.lines = list(lines)
+        self.circles = circles
+        self.squares = squares
+        self.shift = shift
+
+    def inverse(self):
+        if self.op == Op.ADD:
+            return Delta(Op.REMOVE, self.lines, self.circles, self.squares)
+        if self.op == Op.REMOVE:
+            return Delta(Op.ADD, self.lines, self.circles, self.squares)
+        return Delta(Op.SHIFT, self.lines, self.circles, self.squares, (-self.shift[0], -self.shift[1]))
+
+    def same_targets(self, other) -> bool:
+        """True if both deltas touch exactly the same objects"""
+        return all(
+            len(mine) == len(theirs) and target_ids(mine) == target_ids(theirs)
+            for mine, theirs in ((self.lines, other.lines), (self.circles, other.circles), (self.squares, other.squares))
+        )
+
+    def is_empty(self) -> bool:
+        if self.op == Op.SHIFT and self.shift == (0, 0):
+            return True
+        return not (self.lines or len(self.circles) or len(self.squares))
+
+    def nbytes(self) -> int:
+        """Rough upper bound on the memory this delta keeps alive"""
+        shape_bytes = sum(getattr(shapes, 'nbytes', 64 * len(shapes)) for shapes in (self.circles, self.squares))
+        return 64 + sum(64 + line.points.nbytes for line in self.lines) + shape_bytes
+
+    def __repr__(self):
+        return f"{self.op.name}(lines={len(self.lines)}, circles={len(self.circles)}, squares={len(self.squares)}, shift={self.shift})"
+
+
+class History():
+    """
+    Undo/redo stacks of canvas deltas with a memory budget.
+
+    Deltas recorded between two calls to seal() form one undo step (e.g. one erase or translate gesture),
+    consecutive shifts of the same objects are folded together. When the steps kept around exceed
+    budget bytes, the oldest ones get dropped first.
+    """
+
+    def __init__(self, budget=8 * 1024 * 1024):
+        self.budget = budget
+        self.undo_steps = deque()
+        self.redo_steps = []
+        self.current = [] # step being recorded
+        self.nbytes = 0 # sum of nbytes over undo_steps
+
+    def record(self, delta: Delta):
+        if delta.is_empty():
+            return
+        # anything new makes the redo stack meaningless
+        self.redo_steps = []
+        if self.current:
+            last = self.current[-1]
+            if last.op == Op.SHIFT and delta.op == Op.SHIFT and last.same_targets(delta):
+                last.shift = (last.shift[0] + delta.shift[0], last.shift[1] + delta.shift[1])
+                return
+        self.current.append(delta)
+
+    def seal(self):
+        """Closes the step being recorded, so the next delta starts a new one"""
+        if not self.current:
+            return
+        self.push_undo(self.current)
+        self.current = []
+
+    def push_undo(self, step):
+        self.undo_steps.append(step)
+        self.nbytes += sum(delta.nbytes() for delta in step)
+        # always keep at least the latest step, even if it's over budget on its own
+        while self.nbytes > self.budget and len(self.undo_steps) > 1:
+            dropped = self.undo_steps.popleft()
+            self.nbytes -= sum(delta.nbytes() for delta in dropped)
+
+    def pop_undo(self):
+        """Returns the list of deltas that reverts the latest step (in order to apply), or None"""
+        self.seal()
+        if not self.undo_steps:
+            return None
+        step = self.undo_steps.pop()
+        self.nbytes -= sum(delta.nbytes() for delta in step)
+        self.redo_steps.append(step)
+        return [delta.inverse() for delta in reversed(step)]
+
+    def pop_redo(self):
+        """Returns the list of deltas that re-applies the latest undone step, or None"""
+        self.seal()
+        if not self.redo_steps:
+            return None
+        step = self.redo_steps.pop()
+        self.push_undo(step)
+        return list(step)
+
+    def clear(self):
+        self.undo_steps = deque()
+        self.redo_steps = []
+        self.current = []
+        self.nbytes = 0
@@ -0,0 +1,198 @@
+import threading
+import time
+from collections import deque
+
+import cv2 as cv
+
+from timing import NULL_TIMER
+
+
+class LatestSlot():
+    """
+    Holds one item, a new put() replaces whatever wasn't picked up yet (latest frame wins).
+    dropped counts the items that got replaced before anyone took them.
+    """
+
+    def __init__(self):
+        self.item = None
+        self.has_item = False
+        self.closed = False
+        self.dropped = 0
+        self.condition = threading.Condition()
+
+    def put(self, item):
+        with self.condition:
+            if self.has_item:
+                self.dropped += 1
+            self.item = item
+            self.has_item = True
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """Waits for an item, returns None on timeout or once closed"""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.has_item or self.closed, timeout):
+                return None
+            if not self.has_item:
+                return None
+            item, self.item, self.has_item = self.item, None, False
+            return item
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class DropQueue():
+    """
+    Bounded FIFO that never blocks the producer: putting into a full queue drops the oldest item (counted in dropped),
+    so whatever comes out is never more than maxsize items behind.
+    """
+
+    def __init__(self, maxsize):
+        self.items = deque()
+        self.maxsize = maxsize
+        self.closed = False
+        self.dropped = 0
+        self.condition = threading.Condition()
+
+    def put(self, item):
+        with self.condition:
+            if len(self.items) >= self.maxsize:
+                self.items.popleft()
+                self.dropped += 1
+            self.items.append(item)
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """Waits for an item, returns None on timeout or once closed and empty"""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.items or self.closed, timeout):
+                return None
+            return self.items.popleft() if self.items else None
+
+    def __len__(self):
+        return len(self.items)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class Pipeline():
+    """
+    Runs camera capture and hand inference on their own threads, so the loop that renders only waits on the slowest stage.
+
+        capture thread  -> LatestSlot -> inference thread -> DropQueue(render_queue_size) -> render loop (caller)
+
+    Capture never waits: frames inference hasn't picked up yet get replaced by newer ones. Inference never waits
+    either: if the render loop falls behind, the oldest results get dropped. So latency stays bounded by
+    about one frame per stage plus the render queue. Each stage's drop count ends up in stats().
+
+    The detector is only touched from the inference thread and the canvas only from the caller's thread.
+    A timer (timing.StageTimer) gets capture and flip times from the capture thread and 'hands' from the inference one.
+    """
+
+    def __init__(self, cap, detector, flip=True, render_queue_size=2, timer=None):
+        self.cap = cap
+        self.detector = detector
+        self.flip = flip
+        self.frames = LatestSlot()
+        self.results = DropQueue(render_queue_size)
+        self.running = False
+        self.threads = []
+        self.captured = 0
+        self.capture_failures = 0 # over the whole run, for stats
+        self.inferred = 0
+        self.rendered = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.timer = timer if timer is not None else NULL_TIMER
+
+    def start(self):
+        self.running = True
+        self.threads = [
+            threading.Thread(target=self.capture_loop, name='capture', daemon=True),
+            threading.Thread(target=self.inference_loop, name='inference', daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def capture_loop(self):
+        failures_in_a_row = 0
+        while self.running:
+            start = self.timer.start()
+            ret, frame = self.cap.read()
+            timestamp = time.perf_counter()
+            if not ret:
+                self.capture_failures += 1
+                failures_in_a_row += 1
+                if failures_in_a_row > 100:
+                    break # camera is gone, the odd dropped frame is fine
+                continue
+            failures_in_a_row = 0
+            self.timer.stop('capture', start)
+            if self.flip:
+                start = self.timer.start()
+                frame = cv.flip(frame, 1)
+                self.timer.stop('flip', start)
+            self.captured += 1
+            self.frames.put((frame, timestamp))
+        self.frames.close()
+
+    def inference_loop(self):
+        while self.running:
+            item = self.frames.get(timeout=0.1)
+            if item is None:
+                if self.frames.closed:
+                    break
+                continue
+            frame, timestamp = item
+            start = self.timer.start()
+            hands_metadata = self.detector.get_hands_metadata(frame, timestamp)
+            self.timer.stop('hands', start)
+            # the detector reuses its landmark arrays, the render loop needs its own
+            landmarks = [hand.copy() for hand in self.detector.frame_landmarks]
+            self.inferred += 1
+            self.results.put((frame, timestamp, hands_metadata, landmarks))
+        self.results.close()
+
+    def next_result(self, timeout=0.1):
+        """
+        (frame, capture timestamp, hands metadata, landmarks) of the next frame to render,
+        None if nothing showed up in time or the pipeline stopped.
+        """
+        return self.results.get(timeout)
+
+    def rendered_frame(self, timestamp):
+        """Called by the render loop once a frame is on screen, to track input to display latency"""
+        latency = time.perf_counter() - timestamp
+        self.rendered += 1
+        self.latency_sum += latency
+        self.latency_max = max(self.latency_max, latency)
+
+    @property
+    def finished(self):
+        return self.results.closed and not len(self.results)
+
+    def stop(self):
+        self.running = False
+        self.frames.close()
+        self.results.close()
+        for thread in self.threads:
+            thread.join(timeout=1.0)
+        self.threads = []
+
+    def stats(self):
+        return {
+            'captured': self.captured,
+            'capture_failures': self.capture_failures,
+            'dropped_before_inference': self.frames.dropped,
+            'inferred': self.inferred,
+            'dropped_before_render': self.results.dropped,
+            'rendered': self.rendered,
+            'mean_latency_ms': 1000 * self.latency_sum / self.rendered if self.rendered else 0.0,
+            'max_latency_ms': 1000 * self.latency_max,
+        }
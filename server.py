@@ -0,0 +1,403 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import struct
+import threading
+
+from canvas import LINE_THICKNESS, PALETTE
+from history import Op
+
+# Streams the canvas to browsers (or anything else speaking WebSocket) on the local network.
+#
+# The frame loop never waits on the network: canvas changes get turned into small JSON messages on the frame loop's
+# thread and handed over to an asyncio loop running on its own thread, which keeps a mirror of the canvas and
+# a queue of pending messages per client. A client that can't keep up gets its pending messages merged where
+# possible, and once too many pile up they're thrown away for a fresh snapshot instead. Clients joining late
+# start with a snapshot too.
+#
+# Messages, all points as flat [r0, c0, r1, c1, ...] lists and colors as '#rrggbb':
+#   snapshot  rows, columns, thickness, lines [{id, color, points}], circles [{id, color, origin, radius}],
+#             squares [{id, color, anchor, opposite}]
+#   add       lines, circles, squares as in a snapshot (shapes finished, or brought back by undo/redo)
+#   remove    lines, circles, squares as lists of ids
+#   shift     lines, circles, squares as lists of ids, shift [dr, dc]
+#   points    id, color, start, points: a stroke being drawn, its points from start on are these
+#   circle / square   one shape being drawn, same fields as in a snapshot
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+VIEWER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'viewer.html')
+
+
+def css_color(color):
+    blue, green, red = color.value
+    return f'#{red:02x}{green:02x}{blue:02x}'
+
+
+def line_message(line):
+    return {'id': line.id, 'color': css_color(line.color), 'points': line.points.ravel().tolist()}
+
+
+def shape_rows_messages(kind, shape_rows):
+    """Messages for the rows of a ShapeRows or a ShapeTable's columns, kind is 'circle' or 'square'"""
+    ids = shape_rows.ids.tolist()
+    colors = [css_color(PALETTE[color_id]) for color_id in shape_rows.color_ids.tolist()]
+    if kind == 'circle':
+        origins, radii = shape_rows.columns['origin'].tolist(), shape_rows.columns['radius'].ravel().tolist()
+        return [{'id': i, 'color': color, 'origin': origin, 'radius': radius}
+                for i, color, origin, radius in zip(ids, colors, origins, radii)]
+    anchors, opposites = shape_rows.columns['anchor'].tolist(), shape_rows.columns['opposite'].tolist()
+    return [{'id': i, 'color': color, 'anchor': anchor, 'opposite': opposite}
+            for i, color, anchor, opposite in zip(ids, colors, anchors, opposites)]
+
+
+def delta_message(delta):
+    """The add/remove/shift message for a history Delta, built right away since the shapes keep changing after"""
+    if delta.op == Op.ADD:
+        return {
+            'type': 'add',
+            'lines': [line_message(line) for line in delta.lines],
+            'circles': shape_rows_messages('circle', delta.circles) if len(delta.circles) else [],
+            'squares': shape_rows_messages('square', delta.squares) if len(delta.squares) else [],
+        }
+    message = {
+        'type': 'remove' if delta.op == Op.REMOVE else 'shift',
+        'lines': [line.id for line in delta.lines],
+        'circles': delta.circles.ids.tolist() if len(delta.circles) else [],
+        'squares': delta.squares.ids.tolist() if len(delta.squares) else [],
+    }
+    if delta.op == Op.SHIFT:
+        message['shift'] = [int(delta.shift[0]), int(delta.shift[1])]
+    return message
+
+
+def merge(last, message):
+    """message folded into last (both pending for the same client) if they can be, None otherwise"""
+    kind = message['type']
+    if kind != last['type']:
+        return None
+    if kind == 'points' and message['id'] == last['id'] and message['start'] >= last['start']:
+        kept = 2 * (message['start'] - last['start'])
+        if kept > len(last['points']):
+            return None
+        return {**message, 'start': last['start'], 'points': last['points'][:kept] + message['points']}
+    if kind in ('circle', 'square') and message['id'] == last['id']:
+        return message
+    if kind == 'shift' and all(message[field] == last[field] for field in ('lines', 'circles', 'squares')):
+        return {**last, 'shift': [last['shift'][0] + message['shift'][0], last['shift'][1] + message['shift'][1]]}
+    return None
+
+
+class CanvasMirror():
+    """What clients should be seeing, kept up to date from the messages so snapshots never touch the live canvas"""
+
+    def __init__(self, rows, columns, thickness):
+        self.rows = rows
+        self.columns = columns
+        self.thickness = thickness
+        self.lines = {} # id -> line message
+        self.circles = {}
+        self.squares = {}
+
+    def apply(self, message):
+        kind = message['type']
+        if kind == 'add':
+            for field in ('lines', 'circles', 'squares'):
+                shapes = getattr(self, field)
+                # copies, pending messages still point at the originals and shifts replace fields in here
+                shapes.update((shape['id'], dict(shape)) for shape in message[field])
+        elif kind == 'remove':
+            for field in ('lines', 'circles', 'squares'):
+                shapes = getattr(self, field)
+                for shape_id in message[field]:
+                    shapes.pop(shape_id, None)
+        elif kind == 'shift':
+            dr, dc = message['shift']
+            for line_id in message['lines']:
+                line = self.lines.get(line_id)
+                if line is not None:
+                    points = line['points']
+                    line['points'] = [value + (dr if i % 2 == 0 else dc) for i, value in enumerate(points)]
+            for shape_id in message['circles']:
+                circle = self.circles.get(shape_id)
+                if circle is not None:
+                    circle['origin'] = [circle['origin'][0] + dr, circle['origin'][1] + dc]
+            for shape_id in message['squares']:
+                square = self.squares.get(shape_id)
+                if square is not None:
+                    square['anchor'] = [square['anchor'][0] + dr, square['anchor'][1] + dc]
+                    square['opposite'] = [square['opposite'][0] + dr, square['opposite'][1] + dc]
+        elif kind == 'points':
+            line = self.lines.get(message['id'])
+            if line is None:
+                line = self.lines[message['id']] = {'id': message['id'], 'color': message['color'], 'points': []}
+            line['points'] = line['points'][:2 * message['start']] + message['points']
+        elif kind == 'circle':
+            self.circles[message['id']] = {field: message[field] for field in ('id', 'color', 'origin', 'radius')}
+        elif kind == 'square':
+            self.squares[message['id']] = {field: message[field] for field in ('id', 'color', 'anchor', 'opposite')}
+
+    def snapshot(self):
+        return {
+            'type': 'snapshot',
+            'rows': self.rows,
+            'columns': self.columns,
+            'thickness': self.thickness,
+            'lines': list(self.lines.values()),
+            'circles': list(self.circles.values()),
+            'squares': list(self.squares.values()),
+        }
+
+
+class Client():
+    """One connected WebSocket, with the messages it hasn't been sent yet"""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.pending = []
+        self.needs_snapshot = True
+        self.wakeup = asyncio.Event()
+        self.wakeup.set()
+        self.sent = 0
+
+
+class CanvasServer():
+    """
+    Serves viewer.html over HTTP and streams the canvas to every WebSocket connecting to the same port.
+
+    Attach it to a canvas (which subscribes to its deltas), start() it, then call sync(canvas) once per frame
+    after update_state so strokes show up while they're being drawn, not only once they're finished.
+    max_pending is how many messages can wait on one client before it gets a snapshot instead.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8765, max_pending=256):
+        self.host = host
+        self.port = port
+        self.max_pending = max_pending
+        self.mirror = None
+        self.clients = set()
+        self.tasks = set() # every connection's handle_connection and send_loop, so stop() can wind them down
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.started = threading.Event()
+        self.active = {} # id of every shape being drawn -> what was last sent for it
+
+    def attach(self, canvas):
+        """Mirrors the canvas as it is now and follows every change to it, call before start()"""
+        self.mirror = CanvasMirror(canvas.rows, canvas.columns, LINE_THICKNESS)
+        self.mirror.apply({
+            'type': 'add',
+            'lines': [line_message(line) for line in canvas.lines.values()],
+            'circles': shape_rows_messages('circle', canvas.circles.take(canvas.circles.all_ids())),
+            'squares': shape_rows_messages('square', canvas.squares.take(canvas.squares.all_ids())),
+        })
+        canvas.listeners.append(self.publish_delta)
+
+    def start(self):
+        """Runs the server on its own thread, returns once it's listening"""
+        self.thread = threading.Thread(target=self.run, name='canvas server', daemon=True)
+        self.thread.start()
+        self.started.wait()
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = self.loop.run_until_complete(asyncio.start_server(self.handle_connection, self.host, self.port))
+        self.port = self.server.sockets[0].getsockname()[1] # in case port was 0
+        self.started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def stop(self):
+        if self.loop is None:
+            return
+        async def shutdown():
+            self.server.close()
+            # cancel and wait out every connection before stopping, otherwise they get destroyed pending with the loop
+            tasks = list(self.tasks)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.loop.stop()
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop)
+        self.thread.join(timeout=1.0)
+
+    # frame loop side, never blocks
+
+    def publish(self, message):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.dispatch, message)
+
+    def publish_delta(self, delta):
+        """Canvas listener"""
+        message = delta_message(delta)
+        if delta.op == Op.ADD:
+            # finished, sync() shouldn't treat them as being drawn anymore
+            for kind, field in (('line', 'lines'), ('circle', 'circles'), ('square', 'squares')):
+                for shape in message[field]:
+                    self.active.pop((kind, shape['id']), None)
+        self.publish(message)
+
+    def sync(self, canvas):
+        """Publishes what changed in the shapes being drawn since the last call"""
+        for pen in canvas.pens.values():
+            line = pen.line
+            if line.active and line.size:
+                key = ('line', line.id)
+                last = tuple(line.buffer[line.size - 1].tolist())
+                sent = self.active.get(key)
+                if sent != (line.size, last):
+                    # the last point sent may have slid since (see push_point), resend from there
+                    start = 0 if sent is None else min(sent[0], line.size) - 1
+                    start = max(start, 0)
+                    self.active[key] = (line.size, last)
+                    self.publish({'type': 'points', 'id': line.id, 'color': css_color(line.color),
+                                  'start': start, 'points': line.points[start:].ravel().tolist()})
+            for kind, shape in (('circle', pen.circle), ('square', pen.square)):
+                if shape is None:
+                    continue
+                if kind == 'circle':
+                    message = {'type': 'circle', 'id': shape.id, 'color': css_color(shape.color),
+                               'origin': list(shape.origin), 'radius': int(shape.radius)}
+                else:
+                    message = {'type': 'square', 'id': shape.id, 'color': css_color(shape.color),
+                               'anchor': list(shape.anchor), 'opposite': list(shape.opposite)}
+                key = (kind, shape.id)
+                if self.active.get(key) != message:
+                    self.active[key] = message
+                    self.publish(message)
+
+    # asyncio side
+
+    def dispatch(self, message):
+        self.mirror.apply(message)
+        for client in self.clients:
+            if client.needs_snapshot:
+                continue # the snapshot will have it
+            merged = merge(client.pending[-1], message) if client.pending else None
+            if merged is not None:
+                client.pending[-1] = merged
+            else:
+                client.pending.append(message)
+            if len(client.pending) > self.max_pending:
+                client.pending = []
+                client.needs_snapshot = True
+            client.wakeup.set()
+
+    async def handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self.tasks.add(task)
+        try:
+            await self.serve_connection(reader, writer)
+        except asyncio.CancelledError:
+            pass # stop() cancelled it, returning normally keeps asyncio's start_server callback from logging it as an error
+        finally:
+            self.tasks.discard(task)
+
+    async def serve_connection(self, reader, writer):
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        lines = request.decode('latin-1').split('\r\n')
+        headers = {}
+        for header in lines[1:]:
+            name, _, value = header.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('upgrade', '').lower() != 'websocket' or 'sec-websocket-key' not in headers:
+            await self.serve_viewer(writer)
+            return
+
+        accept = base64.b64encode(hashlib.sha1((headers['sec-websocket-key'] + WEBSOCKET_GUID).encode()).digest()).decode()
+        writer.write(('HTTP/1.1 101 Switching Protocols\r\n'
+                      'Upgrade: websocket\r\n'
+                      'Connection: Upgrade\r\n'
+                      f'Sec-WebSocket-Accept: {accept}\r\n\r\n').encode())
+        client = Client(writer)
+        self.clients.add(client)
+        sender = asyncio.ensure_future(self.send_loop(client))
+        self.tasks.add(sender)
+        sender.add_done_callback(self.tasks.discard)
+        try:
+            await self.receive_loop(reader, writer)
+        finally:
+            self.clients.discard(client)
+            sender.cancel()
+            writer.close()
+
+    async def serve_viewer(self, writer):
+        with open(VIEWER_PATH, 'rb') as f:
+            body = f.read()
+        writer.write((f'HTTP/1.1 200 OK\r\nContent-Type: text/html; charset=utf-8\r\n'
+                      f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n').encode() + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def send_loop(self, client):
+        try:
+            while True:
+                await client.wakeup.wait()
+                client.wakeup.clear()
+                if client.needs_snapshot:
+                    client.needs_snapshot = False
+                    client.pending = []
+                    messages = [self.mirror.snapshot()]
+                else:
+                    messages, client.pending = client.pending, []
+                for message in messages:
+                    client.writer.write(encode_frame(json.dumps(message, separators=(',', ':')).encode()))
+                client.sent += len(messages)
+                # slow clients stall here, with whatever comes in meanwhile piling up (and merging) in pending
+                await client.writer.drain()
+        except ConnectionError:
+            pass
+
+    async def receive_loop(self, reader, writer):
+        """Reads what the client sends until it closes, only control frames mean anything"""
+        try:
+            while True:
+                opcode, payload = await read_frame(reader)
+                if opcode == 0x8: # close
+                    writer.write(encode_frame(payload[:2], opcode=0x8))
+                    return
+                if opcode == 0x9: # ping
+                    writer.write(encode_frame(payload, opcode=0xA))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return
+
+
+def encode_frame(payload, opcode=0x1):
+    """One unmasked, unfragmented frame (server to client frames never get masked)"""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+async def read_frame(reader):
+    """(opcode, unmasked payload) of the next frame, client frames are always masked"""
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        (length,) = struct.unpack('!H', await reader.readexactly(2))
+    elif length == 127:
+        (length,) = struct.unpack('!Q', await reader.readexactly(8))
+    mask = await reader.readexactly(4) if second & 0x80 else b'\0\0\0\0'
+    payload = await reader.readexactly(length)
+    # xor with the mask repeated over the payload, as one big integer operation
+    repeated = (mask * (length // 4 + 1))[:length]
+    payload = (int.from_bytes(payload, 'big') ^ int.from_bytes(repeated, 'big')).to_bytes(length, 'big')
+    return first & 0x0F, payload
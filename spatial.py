@@ -0,0 +1,131 @@
+import numpy as np
+
+
+class SpatialGrid():
+    """
+    Uniform grid that buckets objects by the cells their bounding boxes touch.
+
+    This is the spatial query system the canvas uses so erasing and translating only look at
+    objects near the cursor instead of every point ever drawn.
+    Everything here is in (row, col) convention, same as the canvas.
+    """
+
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.cells = {} # (cell_row, cell_col) -> set of objects in that cell
+        self.object_cells = {} # object -> set of cells it has been inserted into
+
+    def cell_range(self, top, left, bottom, right):
+        """Yields every cell key covered by the (inclusive) box given."""
+        size = self.cell_size
+        for cell_r in range(int(top) // size, int(bottom) // size + 1):
+            for cell_c in range(int(left) // size, int(right) // size + 1):
+                yield (cell_r, cell_c)
+
+    def insert(self, obj, top, left, bottom, right):
+        """
+        Registers obj in every cell overlapping the box. Inserting the same object again only adds cells,
+        which is how strokes grow one segment at a time.
+        """
+        obj_cells = self.object_cells.setdefault(obj, set())
+        for cell in self.cell_range(top, left, bottom, right):
+            if cell in obj_cells:
+                continue
+            obj_cells.add(cell)
+            self.cells.setdefault(cell, set()).add(obj)
+
+    def insert_segment(self, obj, start, end):
+        """Registers the segment between two (r, c) points as part of obj."""
+        (r0, c0), (r1, c1) = start, end
+        self.insert(obj, min(r0, r1), min(c0, c1), max(r0, r1), max(c0, c1))
+
+    def polyline_cells(self, points, owners):
+        """
+        Packed cell keys covered by the boxes of every segment of a polyline, plus the owner of each key.
+        owners[i] is who point i belongs to, segments between points of different owners are skipped
+        (that's where one polyline ends and the next starts). Lone points still get their own cell.
+        """
+        cells = (points // self.cell_size).astype(np.int64)
+        joined = owners[1:] == owners[:-1]
+        low = np.concatenate([cells, np.minimum(cells[:-1], cells[1:])[joined]])
+        high = np.concatenate([cells, np.maximum(cells[:-1], cells[1:])[joined]])
+        box_owners = np.concatenate([owners, owners[:-1][joined]])
+
+        # enumerate every cell of every box: box i covers heights[i] * widths[i] cells
+        heights = high[:, 0] - low[:, 0] + 1
+        widths = high[:, 1] - low[:, 1] + 1
+        counts = heights * widths
+        box = np.repeat(np.arange(len(low)), counts)
+        step = np.arange(len(box)) - np.repeat(np.cumsum(counts) - counts, counts)
+        rows = low[box, 0] + step // widths[box]
+        cols = low[box, 1] + step % widths[box]
+        # pack (cell_row, cell_col) into one int64 so sorting/uniquing works on a flat array, much faster than axis=0.
+        # the row goes in the (signed) high half, the col offset to be non negative in the low half
+        keys = (rows << 32) + (cols + (1 << 31))
+        return box_owners[box], keys
+
+    def insert_polyline(self, obj, points):
+        """Registers obj in every cell the segments between consecutive (r, c) rows of points can touch."""
+        if len(points) == 0:
+            return
+        _, keys = self.polyline_cells(points, np.zeros(len(points), dtype=np.int64))
+        keys = np.unique(keys)
+        self.insert_keys([obj], np.zeros(len(keys), dtype=np.int64), keys)
+
+    def insert_polyline_runs(self, objs, points, offsets):
+        """
+        Bulk insert_polyline: objs[i] owns the rows points[offsets[i]:offsets[i+1]].
+        Does the cell bucketing for every object in one vectorized pass, used when loading whole canvases.
+        """
+        if len(points) == 0:
+            return
+        owners, keys = self.polyline_cells(points, np.repeat(np.arange(len(objs)), np.diff(offsets)))
+        order = np.lexsort((keys, owners))
+        owners, keys = owners[order], keys[order]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = (owners[1:] != owners[:-1]) | (keys[1:] != keys[:-1])
+        self.insert_keys(objs, owners[first], keys[first])
+
+    def insert_keys(self, objs, owners, keys):
+        """Adds objs[owners[i]] to the cell of each packed key"""
+        cell_rows = (keys >> 32).tolist()
+        cell_cols = ((keys & 0xFFFFFFFF) - (1 << 31)).tolist()
+        for owner, cell in zip(owners.tolist(), zip(cell_rows, cell_cols)):
+            obj = objs[owner]
+            obj_cells = self.object_cells.setdefault(obj, set())
+            if cell in obj_cells:
+                continue
+            obj_cells.add(cell)
+            self.cells.setdefault(cell, set()).add(obj)
+
+    def remove(self, obj):
+        """Drops obj from all cells it lives in. Unknown objects are ignored."""
+        for cell in self.object_cells.pop(obj, ()):
+            bucket = self.cells[cell]
+            bucket.discard(obj)
+            if not bucket:
+                del self.cells[cell]
+
+    def query(self, point, radius):
+        """
+        Returns the set of objects whose cells overlap the square around a circle.
+        This is a candidate set, callers still do the exact overlap test.
+        """
+        r, c = point
+        radius = max(radius, 0)
+        found = set()
+        for cell in self.cell_range(r - radius, c - radius, r + radius, c + radius):
+            bucket = self.cells.get(cell)
+            if bucket:
+                found.update(bucket)
+        return found
+
+    def clear(self):
+        self.cells = {}
+        self.object_cells = {}
+
+    def __contains__(self, obj):
+        return obj in self.object_cells
+
+    def __len__(self):
+        return len(self.object_cells)
@@ -0,0 +1,285 @@
+import os
+import queue
+import struct
+import threading
+
+import numpy as np
+
+from canvas import PALETTE, CircleTable, Line, ShapeRows, SquareTable
+from history import Delta, Op
+
+# On disk a session is a directory holding:
+#   snapshot.npz   every stroke's points concatenated, with per-stroke offsets/ids/colors, plus the shape tables
+#   ops.<gen>.log  append-only log of every Delta applied since snapshot generation <gen> was written
+#
+# Each log record is a uint32 byte length followed by
+#   header: op, dr, dc, number of lines, circles, squares
+#   int64 ids of the lines, then (ADD only) their uint8 colors, uint32 sizes and int32 points
+#   for circles then squares: int64 ids, then (ADD only) uint8 colors and every int32 column of the table
+# A crash can only ever cut off the last record, which gets ignored on load.
+
+OPS = list(Op)
+RECORD_LENGTH = struct.Struct('<I')
+RECORD_HEADER = struct.Struct('<BiiIII')
+SNAPSHOT_NAME = 'snapshot.npz'
+
+
+def log_name(generation):
+    return f'ops.{generation}.log'
+
+
+def encode_delta(delta: Delta) -> bytes:
+    """Serializes one delta into a log record"""
+    lines = delta.lines
+    circles, squares = delta.circles, delta.squares
+    parts = [
+        RECORD_HEADER.pack(OPS.index(delta.op), int(delta.shift[0]), int(delta.shift[1]),
+                           len(lines), len(circles), len(squares)),
+        np.array([line.id for line in lines], dtype=np.int64).tobytes(),
+    ]
+    if delta.op == Op.ADD:
+        parts.append(np.array([PALETTE.index(line.color) for line in lines], dtype=np.uint8).tobytes())
+        parts.append(np.array([line.size for line in lines], dtype=np.uint32).tobytes())
+        parts.extend(line.points.tobytes() for line in lines)
+
+    for table, shape_rows in ((CircleTable, circles), (SquareTable, squares)):
+        if not len(shape_rows):
+            continue
+        parts.append(np.asarray(shape_rows.ids, dtype=np.int64).tobytes())
+        if delta.op == Op.ADD:
+            parts.append(np.asarray(shape_rows.color_ids, dtype=np.uint8).tobytes())
+            for name, _ in table.fields:
+                parts.append(np.ascontiguousarray(shape_rows.columns[name], dtype=np.int32).tobytes())
+
+    body = b''.join(parts)
+    return RECORD_LENGTH.pack(len(body)) + body
+
+
+def decode_deltas(buf, canvas):
+    """
+    Yields the deltas stored in a log buffer, resolving line ids against canvas.lines.
+    Deltas have to be applied as they come out, since later records refer to lines created by earlier ones.
+    """
+    offset = 0
+    while offset + RECORD_LENGTH.size <= len(buf):
+        (length,) = RECORD_LENGTH.unpack_from(buf, offset)
+        start = offset + RECORD_LENGTH.size
+        if start + length > len(buf):
+            break # torn record at the end of the log
+        offset = start + length
+
+        op_index, dr, dc, num_lines, num_circles, num_squares = RECORD_HEADER.unpack_from(buf, start)
+        op = OPS[op_index]
+        cursor = start + RECORD_HEADER.size
+
+        def read(dtype, count):
+            nonlocal cursor
+            array = np.frombuffer(buf, dtype=dtype, count=count, offset=cursor)
+            cursor += array.nbytes
+            return array
+
+        line_ids = read(np.int64, num_lines)
+        if op == Op.ADD:
+            colors = read(np.uint8, num_lines)
+            sizes = read(np.uint32, num_lines)
+            lines = []
+            for line_id, color_id, size in zip(line_ids.tolist(), colors.tolist(), sizes.tolist()):
+                points = read(np.int32, 2 * size).reshape(-1, 2)
+                line = Line(PALETTE[color_id], points[0])
+                line.points = points
+                line.id = line_id
+                line.active = False
+                lines.append(line)
+        else:
+            lines = [canvas.lines[line_id] for line_id in line_ids.tolist() if line_id in canvas.lines]
+
+        shapes = []
+        for table, count, on_canvas in ((CircleTable, num_circles, canvas.circles), (SquareTable, num_squares, canvas.squares)):
+            ids = read(np.int64, count)
+            columns = {}
+            color_ids = None
+            if op == Op.ADD and count:
+                color_ids = read(np.uint8, count)
+                columns = {name: read(np.int32, width * count).reshape(count, width) for name, width in table.fields}
+            elif count:
+                # same as lines, skip shapes that aren't there (older logs could remove shapes that were never added)
+                ids = np.array([shape_id for shape_id in ids.tolist() if shape_id in on_canvas], dtype=np.int64)
+            shapes.append(ShapeRows(ids, color_ids, columns))
+
+        yield Delta(op, lines, shapes[0], shapes[1], (dr, dc))
+
+
+def save_snapshot(canvas, path, generation=0):
+    """Writes every finished shape on the canvas into one .npz file (atomically)"""
+    lines = [line for line in canvas.lines.values() if not line.active]
+    sizes = np.array([line.size for line in lines], dtype=np.int64)
+    offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    points = np.concatenate([line.points for line in lines]) if lines else np.empty((0, 2), dtype=np.int32)
+
+    arrays = {
+        'generation': np.int64(generation),
+        'rows': np.int64(canvas.rows),
+        'columns': np.int64(canvas.columns),
+        'next_line_id': np.int64(canvas.next_line_id),
+        'line_ids': np.array([line.id for line in lines], dtype=np.int64),
+        'line_colors': np.array([PALETTE.index(line.color) for line in lines], dtype=np.uint8),
+        'line_offsets': offsets,
+        'line_points': points,
+    }
+    for prefix, table, active in zip(('circle', 'square'), (canvas.circles, canvas.squares), canvas.active_shape_ids()):
+        # shapes being drawn get logged as an ADD once they're finished, so leave them out like active lines
+        finished = ~np.isin(table.ids[:table.size], list(active))
+        arrays[f'{prefix}_next_id'] = np.int64(table.next_id)
+        arrays[f'{prefix}_ids'] = table.ids[:table.size][finished]
+        arrays[f'{prefix}_colors'] = table.color_ids[:table.size][finished]
+        for name, _ in table.fields:
+            arrays[f'{prefix}_{name}'] = table.column(name)[finished]
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def read_canvas_size(directory):
+    """(rows, columns) of the canvas saved in a session directory, None if it has no snapshot yet"""
+    path = os.path.join(directory, SNAPSHOT_NAME)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        if 'rows' not in data:
+            return None
+        return int(data['rows']), int(data['columns'])
+
+
+def load_snapshot(canvas, path):
+    """Replaces everything on the canvas with the contents of a snapshot, returns its generation"""
+    with np.load(path) as data:
+        canvas.clear()
+        canvas.history.clear()
+
+        offsets = data['line_offsets']
+        points = data['line_points']
+        lines = []
+        for i, (line_id, color_id) in enumerate(zip(data['line_ids'].tolist(), data['line_colors'].tolist())):
+            line_points = points[offsets[i]:offsets[i + 1]]
+            line = Line(PALETTE[color_id], line_points[0])
+            line.points = line_points
+            line.id = line_id
+            line.active = False
+            lines.append(line)
+
+        shapes = []
+        for prefix, table in (('circle', CircleTable), ('square', SquareTable)):
+            columns = {name: data[f'{prefix}_{name}'] for name, _ in table.fields}
+            shapes.append(ShapeRows(data[f'{prefix}_ids'], data[f'{prefix}_colors'], columns))
+
+        canvas.add_shapes(lines, shapes[0], shapes[1])
+        canvas.next_line_id = max(canvas.next_line_id, int(data['next_line_id']))
+        canvas.circles.next_id = max(canvas.circles.next_id, int(data['circle_next_id']))
+        canvas.squares.next_id = max(canvas.squares.next_id, int(data['square_next_id']))
+        return int(data['generation'])
+
+
+class SessionStore():
+    """
+    Keeps a canvas persisted in a session directory.
+
+    attach() hooks the store up as a canvas listener: every delta is encoded on the spot (cheap, a few small arrays)
+    and queued, a background thread appends everything queued to the log and flushes once per flush_interval seconds.
+    So the frame loop never waits on the disk. load() restores the latest snapshot and replays the log written after it.
+    """
+
+    def __init__(self, directory, flush_interval=0.5):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.generation = 0
+        self.pending = queue.SimpleQueue()
+        self.log_file = None
+        self.lock = threading.Lock() # guards log_file between the writer thread and snapshots
+        self.stop_event = threading.Event()
+        self.writer = None
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def load(self, canvas) -> bool:
+        """Restores the canvas from disk, returns False if the session directory was empty"""
+        snapshot_path = self.path(SNAPSHOT_NAME)
+        found = False
+        if os.path.exists(snapshot_path):
+            self.generation = load_snapshot(canvas, snapshot_path)
+            found = True
+
+        log_path = self.path(log_name(self.generation))
+        if os.path.exists(log_path):
+            with open(log_path, 'rb') as f:
+                buf = f.read()
+            for delta in decode_deltas(buf, canvas):
+                canvas.apply_delta(delta)
+            canvas.next_line_id = max([canvas.next_line_id] + [line_id + 1 for line_id in canvas.lines])
+            found = True
+        return found
+
+    def attach(self, canvas):
+        """Starts logging every change made to canvas"""
+        self.log_file = open(self.path(log_name(self.generation)), 'ab')
+        canvas.listeners.append(self.log_delta)
+        self.stop_event.clear()
+        self.writer = threading.Thread(target=self.write_loop, name='session-log', daemon=True)
+        self.writer.start()
+
+    def log_delta(self, delta):
+        self.pending.put(encode_delta(delta))
+
+    def write_loop(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        """Writes out everything queued so far in one go"""
+        with self.lock:
+            chunks = []
+            while True:
+                try:
+                    chunks.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            if chunks and self.log_file is not None:
+                self.log_file.write(b''.join(chunks))
+                self.log_file.flush()
+
+    def save_snapshot(self, canvas):
+        """
+        Writes a new snapshot and starts a fresh log for it. Deltas still queued belong to the old log,
+        which is redundant once the snapshot is on disk, so it gets deleted.
+        """
+        self.flush()
+        generation = self.generation + 1
+        save_snapshot(canvas, self.path(SNAPSHOT_NAME), generation)
+        with self.lock:
+            old_log = self.path(log_name(self.generation))
+            if self.log_file is not None:
+                self.log_file.close()
+                self.log_file = open(self.path(log_name(generation)), 'ab')
+            self.generation = generation
+        if os.path.exists(old_log):
+            os.remove(old_log)
+
+    def close(self, canvas=None):
+        """Stops the writer (flushing the log), optionally snapshotting canvas first"""
+        if canvas is not None:
+            canvas.end_all_drawing()
+            self.save_snapshot(canvas)
+        if self.writer is not None:
+            self.stop_event.set()
+            self.writer.join()
+            self.writer = None
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
+        if canvas is not None and self.log_delta in canvas.listeners:
+            canvas.listeners.remove(self.log_delta)
@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+from canvas import Canvas
+from conftest import FRAME_SHAPE, canvas_state
+from eventlog import GestureLog, frame_metadata, read_gesture_log
+from hands import Gesture
+
+TIPS = ('idx_fing_tip', 'mid_fing_tip', 'ring_fing_tip', 'pinky_fing_tip')
+# somewhere on a color and every shape button (see get_button_label_map), and on clear
+BUTTONS = [(25, 220), (25, 380), (25, 550), (140, 40), (270, 40), (410, 40)]
+CLEAR = (30, 60)
+# mostly drawing, so there's plenty on the canvas to erase and move around
+GESTURE_ODDS = {Gesture.DRAW: 0.5, Gesture.HOVER: 0.2, Gesture.TRANSLATE: 0.2, Gesture.ERASE: 0.1}
+
+
+def replay_state(canvas):
+    """canvas_state plus what else a replay has to get right"""
+    return canvas_state(canvas) + (canvas.next_line_id, len(canvas.history.undo_steps), canvas.color, canvas.shape)
+
+
+def session(seed, frames=3000):
+    """
+    Per frame hands metadata of a made up session: runs of every gesture wandering around the canvas,
+    button presses, frames without hands and stretches with a second hand.
+    """
+    rng = np.random.default_rng(seed)
+    gestures = list(GESTURE_ODDS)
+    positions = {0: np.array([300.0, 300.0]), 1: np.array([200.0, 450.0])}
+    session = []
+    while len(session) < frames:
+        run = int(rng.integers(1, 40))
+        if rng.random() < 0.05:
+            session.extend([[]] * run)
+            continue
+        hands = [0, 1] if rng.random() < 0.2 else [int(rng.integers(0, 2))]
+        run_gestures = {hand: gestures[rng.choice(len(gestures), p=list(GESTURE_ODDS.values()))] for hand in hands}
+        for _ in range(run):
+            metadata = []
+            for hand in hands:
+                step = rng.normal(0, 6, 2)
+                position = positions[hand] = np.clip(positions[hand] + step, (100, 100), (470, 630))
+                if rng.random() < 0.01:
+                    position = np.array(BUTTONS[rng.integers(len(BUTTONS))], dtype=float)
+                elif len(session) == frames // 2:
+                    position = np.array(CLEAR, dtype=float)
+                gesture = run_gestures[hand]
+                data = {'gesture': gesture, 'hand': hand, 'origin': None, 'radius': None, 'shift': None}
+                for i, tip in enumerate(TIPS):
+                    data[tip] = (float(position[0] + i), float(position[1] - i))
+                if gesture != Gesture.HOVER:
+                    data['origin'] = (int(position[0]), int(position[1]))
+                    data['radius'] = float(rng.uniform(10, 40))
+                if gesture == Gesture.TRANSLATE:
+                    data['shift'] = (int(round(step[0])), int(round(step[1])))
+                metadata.append(data)
+            session.append(metadata)
+    return session[:frames]
+
+
+def write_log(path, frames):
+    log = GestureLog(str(path), FRAME_SHAPE)
+    for metadata in frames:
+        log.write(metadata)
+    log.close()
+    return read_gesture_log(str(path))
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_replay_matches_update_state(tmp_path, seed):
+    frames = session(seed)
+    live = Canvas(480, 640)
+    for metadata in frames:
+        live.update_state(FRAME_SHAPE, metadata)
+
+    frame_shape, events = write_log(tmp_path / 'session.glog', frames)
+    assert frame_shape == FRAME_SHAPE
+    replayed = Canvas(480, 640)
+    replayed.replay_events(frame_shape, events)
+
+    assert replay_state(replayed) == replay_state(live)
+    # the spatial index got caught up, hit-tests agree everywhere
+    for r in range(0, 480, 30):
+        for c in range(0, 640, 30):
+            assert replayed.lines_near((r, c), 15) == live.lines_near((r, c), 15)
+    # same step boundaries, undoing goes through the same states
+    for _ in range(5):
+        assert replayed.undo() == live.undo()
+        assert replay_state(replayed) == replay_state(live)
+
+    live_frame, replayed_frame = np.zeros(FRAME_SHAPE, np.uint8), np.zeros(FRAME_SHAPE, np.uint8)
+    assert (live.draw_layer(live_frame) == replayed.draw_layer(replayed_frame)).all()
+
+
+def test_log_keeps_what_update_state_needs(tmp_path):
+    frames = session(3, frames=300)
+    _, events = write_log(tmp_path / 'session.glog', frames)
+    bounds = np.flatnonzero(np.diff(events['frame'], prepend=-1, append=-1))
+    decoded = [frame_metadata(events[start:end]) for start, end in zip(bounds[:-1], bounds[1:])]
+    assert decoded == frames
+
+
+def test_torn_last_record_is_ignored(tmp_path):
+    frames = session(4, frames=200)
+    path = tmp_path / 'session.glog'
+    _, events = write_log(path, frames)
+    with open(path, 'rb') as f:
+        buf = f.read()
+    with open(path, 'wb') as f:
+        f.write(buf[:-5])
+    _, torn = read_gesture_log(str(path))
+    assert len(torn) == len(events) - 1
+    assert (torn == events[:-1]).all()
+
+
+def test_empty_log_replays_to_empty_canvas(tmp_path):
+    frame_shape, events = write_log(tmp_path / 'empty.glog', [])
+    canvas = Canvas(480, 640)
+    canvas.replay_events(frame_shape, events)
+    assert replay_state(canvas) == replay_state(Canvas(480, 640))
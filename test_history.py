@@ -0,0 +1,122 @@
+import pytest
+
+from canvas import Canvas, Shape
+from conftest import FRAME_SHAPE, canvas_state, gesture, hand
+from hands import Gesture
+from history import Delta, History, Op
+
+
+def stroke(canvas, shape, row, columns, hand_id=0):
+    """Draws one shape along row, then hovers to finish it"""
+    canvas.shape = shape
+    for column in columns:
+        canvas.update_state(FRAME_SHAPE, [hand(Gesture.DRAW, (row, column), hand_id)])
+    canvas.update_state(FRAME_SHAPE, [hand(Gesture.HOVER, (row, columns[-1]), hand_id)])
+
+
+def drawn_canvas():
+    canvas = Canvas(480, 640)
+    stroke(canvas, Shape.LINE, 250, range(100, 300, 10))
+    stroke(canvas, Shape.CIRCLE, 350, range(400, 440, 10))
+    stroke(canvas, Shape.SQUARE, 400, range(100, 160, 10))
+    stroke(canvas, Shape.LINE, 300, range(400, 600, 10))
+    return canvas
+
+
+def test_undo_everything_then_redo_everything():
+    canvas = drawn_canvas()
+    gesture(canvas, Gesture.TRANSLATE, (250, 150))
+    gesture(canvas, Gesture.ERASE, (350, 430))
+    gesture(canvas, Gesture.TRANSLATE, (400, 130))
+    assert len(canvas.circles) == 0 and canvas.lines[0].points[0].tolist() == [262, 91]
+    states = [canvas_state(canvas)]
+    while canvas.undo():
+        states.append(canvas_state(canvas))
+    assert canvas_state(canvas) == ({}, {}, {})
+    for expected in reversed(states[:-1]):
+        assert canvas.redo()
+        assert canvas_state(canvas) == expected
+    assert not canvas.redo()
+
+
+def test_one_translate_gesture_is_one_step():
+    canvas = drawn_canvas()
+    before = canvas_state(canvas)
+    gesture(canvas, Gesture.TRANSLATE, (250, 150), frames=10)
+    assert canvas_state(canvas) != before
+    assert canvas.undo()
+    assert canvas_state(canvas) == before
+
+
+def test_new_change_drops_redo():
+    canvas = drawn_canvas()
+    canvas.undo()
+    stroke(canvas, Shape.LINE, 200, range(100, 200, 10))
+    assert not canvas.redo()
+
+
+def test_finish_drawing_is_its_own_step_before_erasing():
+    canvas = Canvas(480, 640)
+    canvas.shape = Shape.CIRCLE
+    for column in range(400, 440, 10):
+        canvas.update_state(FRAME_SHAPE, [hand(Gesture.DRAW, (300, column))])
+    gesture(canvas, Gesture.ERASE, (300, 430))
+    assert len(canvas.circles) == 0
+    assert canvas.undo() and len(canvas.circles) == 1
+    assert canvas.undo() and len(canvas.circles) == 0
+
+
+@pytest.mark.parametrize('name', [Gesture.ERASE, Gesture.TRANSLATE])
+@pytest.mark.parametrize('shape', [Shape.LINE, Shape.CIRCLE, Shape.SQUARE])
+def test_other_hand_leaves_shapes_being_drawn_alone(name, shape):
+    canvas = Canvas(480, 640)
+    canvas.shape = shape
+    for column in range(400, 440, 10):
+        canvas.update_state(FRAME_SHAPE, [hand(Gesture.DRAW, (300, column)),
+                                          hand(name, (300, 405), hand=1, shift=(5, 5))])
+    canvas.update_state(FRAME_SHAPE, [hand(Gesture.HOVER, (300, 440)), hand(Gesture.HOVER, (100, 150), hand=1)])
+    drawn = canvas_state(canvas)
+    assert sum(map(len, drawn)) == 1
+    # the ADD is the only step, the erase/translate never saw the shape
+    assert canvas.undo() and canvas_state(canvas) == ({}, {}, {})
+    assert not canvas.undo()
+    assert canvas.redo() and canvas_state(canvas) == drawn
+
+
+def test_clear_undoes_in_one_step():
+    canvas = drawn_canvas()
+    before = canvas_state(canvas)
+    canvas.clear()
+    assert canvas_state(canvas) == ({}, {}, {})
+    assert canvas.undo()
+    assert canvas_state(canvas) == before
+
+
+def test_budget_drops_oldest_steps_but_keeps_latest():
+    canvas = Canvas(480, 640, history_budget=1)
+    stroke(canvas, Shape.LINE, 250, range(100, 300, 10))
+    stroke(canvas, Shape.LINE, 300, range(100, 300, 10))
+    assert len(canvas.history.undo_steps) == 1
+    assert canvas.undo() and len(canvas.lines) == 1
+    assert not canvas.undo()
+
+
+def test_consecutive_shifts_of_same_targets_fold():
+    canvas = drawn_canvas()
+    line = canvas.lines[0]
+    history = History()
+    history.record(Delta(Op.SHIFT, [line], shift=(1, 2)))
+    history.record(Delta(Op.SHIFT, [line], shift=(3, -1)))
+    history.record(Delta(Op.SHIFT, [canvas.lines[1]], shift=(1, 1)))
+    history.seal()
+    step = history.undo_steps[-1]
+    assert [delta.shift for delta in step] == [(4, 1), (1, 1)]
+    assert [delta.shift for delta in history.pop_undo()] == [(-1, -1), (-4, -1)]
+    assert history.pop_redo() == step
+
+
+def test_empty_deltas_are_not_steps():
+    history = History()
+    history.record(Delta(Op.REMOVE))
+    history.seal()
+    assert history.pop_undo() is None
@@ -0,0 +1,164 @@
+import os
+import shutil
+
+from canvas import Canvas, Shape
+from conftest import FRAME_SHAPE, canvas_state, gesture, hand
+from hands import Gesture
+from store import SNAPSHOT_NAME, SessionStore, decode_deltas, encode_delta, log_name
+
+
+def draw(canvas, row=250, shapes=(Shape.LINE, Shape.CIRCLE, Shape.SQUARE)):
+    """One of each shape side by side along row (right of the shape buttons), each finished with a hover"""
+    for i, shape in enumerate(shapes):
+        canvas.shape = shape
+        for column in range(120 + 160 * i, 200 + 160 * i, 10):
+            canvas.update_state(FRAME_SHAPE, [hand(Gesture.DRAW, (row, column))])
+        canvas.update_state(FRAME_SHAPE, [hand(Gesture.HOVER, (row, column))])
+
+
+def loaded(directory):
+    canvas = Canvas(480, 640)
+    assert SessionStore(directory).load(canvas)
+    return canvas
+
+
+def test_log_round_trip(tmp_path):
+    canvas = Canvas(480, 640)
+    store = SessionStore(str(tmp_path))
+    store.attach(canvas)
+    draw(canvas)
+    gesture(canvas, Gesture.TRANSLATE, (250, 150))
+    gesture(canvas, Gesture.ERASE, (250, 350))
+    assert len(canvas.circles) == 0
+    canvas.undo()
+    canvas.undo()
+    canvas.redo()
+    store.close()
+    assert not os.path.exists(tmp_path / SNAPSHOT_NAME)
+    assert canvas_state(loaded(str(tmp_path))) == canvas_state(canvas)
+
+
+def test_snapshot_plus_log_tail(tmp_path):
+    canvas = Canvas(480, 640)
+    store = SessionStore(str(tmp_path))
+    store.attach(canvas)
+    draw(canvas)
+    store.save_snapshot(canvas)
+    draw(canvas, row=350)
+    gesture(canvas, Gesture.ERASE, (350, 150))
+    gesture(canvas, Gesture.TRANSLATE, (250, 460))
+    assert len(canvas.lines) == 1
+    store.close()
+    assert os.path.exists(tmp_path / log_name(1)) and not os.path.exists(tmp_path / log_name(0))
+    restored = loaded(str(tmp_path))
+    assert canvas_state(restored) == canvas_state(canvas)
+    # ids keep counting from where the session left off
+    draw(restored, row=400, shapes=(Shape.LINE,))
+    assert len(restored.lines) == len(canvas.lines) + 1
+
+
+def test_close_with_canvas_snapshots_everything(tmp_path):
+    canvas = Canvas(480, 640)
+    store = SessionStore(str(tmp_path))
+    store.attach(canvas)
+    draw(canvas)
+    canvas.shape = Shape.LINE
+    canvas.update_state(FRAME_SHAPE, [hand(Gesture.DRAW, (400, 150))])
+    canvas.update_state(FRAME_SHAPE, [hand(Gesture.DRAW, (400, 250))]) # still being drawn when closing
+    store.close(canvas)
+    assert os.path.getsize(tmp_path / log_name(1)) == 0
+    assert canvas_state(loaded(str(tmp_path))) == canvas_state(canvas)
+
+
+def test_crash_mid_record_drops_only_the_last_record(tmp_path):
+    canvas = Canvas(480, 640)
+    records = []
+    canvas.listeners.append(lambda delta: records.append(encode_delta(delta)))
+    store = SessionStore(str(tmp_path))
+    store.attach(canvas)
+    draw(canvas, shapes=(Shape.LINE, Shape.CIRCLE))
+    before = canvas_state(canvas)
+    draw(canvas, row=350, shapes=(Shape.SQUARE,))
+    store.close()
+
+    path = tmp_path / log_name(0)
+    with open(path, 'rb') as f:
+        buf = f.read()
+    last = len(records[-1])
+    for cut in (1, last // 2, last - 1):
+        with open(path, 'wb') as f:
+            f.write(buf[:len(buf) - cut])
+        assert canvas_state(loaded(str(tmp_path))) == before
+
+
+def test_crash_while_snapshotting(tmp_path):
+    canvas = Canvas(480, 640)
+    store = SessionStore(str(tmp_path))
+    store.attach(canvas)
+    draw(canvas)
+    store.save_snapshot(canvas)
+    gesture(canvas, Gesture.ERASE, (250, 150))
+    assert len(canvas.lines) == 0
+    store.flush()
+    expected = canvas_state(canvas)
+    saved = tmp_path / 'saved'
+    shutil.copytree(tmp_path, saved, ignore=shutil.ignore_patterns('saved'))
+
+    # died writing the new snapshot: the half written .tmp is ignored, old snapshot + its log still load
+    draw(canvas, row=350)
+    with open(saved / (SNAPSHOT_NAME + '.tmp'), 'wb') as f:
+        f.write(b'PK\x03\x04 not quite a snapshot')
+    assert canvas_state(loaded(str(saved))) == expected
+
+    # died after the new snapshot went in but before the old log was deleted: the stale log is ignored
+    store.save_snapshot(canvas)
+    store.close()
+    shutil.copy(saved / log_name(1), tmp_path / log_name(1))
+    assert os.path.exists(tmp_path / log_name(2))
+    assert canvas_state(loaded(str(tmp_path))) == canvas_state(canvas)
+
+
+def test_erasing_a_shape_still_being_drawn(tmp_path):
+    canvas = Canvas(480, 640)
+    canvas.shape = Shape.CIRCLE
+    store = SessionStore(str(tmp_path))
+    store.attach(canvas)
+    canvas.update_state(FRAME_SHAPE, [hand(Gesture.DRAW, (300, 400))])
+    canvas.update_state(FRAME_SHAPE, [hand(Gesture.DRAW, (300, 430))])
+    canvas.update_state(FRAME_SHAPE, [hand(Gesture.ERASE, (300, 430))])
+    store.close()
+    assert canvas_state(loaded(str(tmp_path))) == canvas_state(canvas) == ({}, {}, {})
+    assert canvas.undo() and len(canvas.circles) == 1
+    assert canvas.undo() and len(canvas.circles) == 0
+
+
+def test_second_hand_translating_then_undo(tmp_path):
+    canvas = Canvas(480, 640)
+    canvas.shape = Shape.CIRCLE
+    store = SessionStore(str(tmp_path))
+    store.attach(canvas)
+    draw(canvas, row=200, shapes=(Shape.LINE,))
+    canvas.shape = Shape.CIRCLE
+    for column in range(400, 440, 10):
+        canvas.update_state(FRAME_SHAPE, [hand(Gesture.DRAW, (300, column)),
+                                          hand(Gesture.TRANSLATE, (300, 405), hand=1, shift=(5, 5))])
+    canvas.update_state(FRAME_SHAPE, [hand(Gesture.HOVER, (300, 440)),
+                                      hand(Gesture.TRANSLATE, (200, 150), hand=1, shift=(5, 5))])
+    assert canvas.lines[0].points[0].tolist() == [205, 125]
+    while canvas.undo():
+        pass
+    store.close()
+    assert canvas_state(loaded(str(tmp_path))) == canvas_state(canvas) == ({}, {}, {})
+
+
+def test_decode_skips_shapes_that_are_not_there():
+    canvas = Canvas(480, 640)
+    records = []
+    canvas.listeners.append(records.append)
+    draw(canvas)
+    # an older log could remove shapes it never added
+    buf = b''.join(encode_delta(delta.inverse()) for delta in records) + b''.join(map(encode_delta, records))
+    empty = Canvas(480, 640)
+    for delta in decode_deltas(buf, empty):
+        empty.apply_delta(delta)
+    assert len(empty.lines) == 1 and len(empty.circles) == 1 and len(empty.squares) == 1
@@ -0,0 +1,160 @@
+import bisect
+import csv
+import json
+import threading
+import time
+
+import cv2 as cv
+import numpy as np
+
+# Per stage latency instrumentation for the frame loop.
+#
+# Code being timed always goes through a timer:
+#     start = self.timer.start()
+#     ...
+#     self.timer.stop('stage name', start)
+# and gets NULL_TIMER when instrumentation is off, whose methods do nothing, so the cost is two no-op calls per stage.
+
+# histogram bucket edges in ms, log spaced from 10us to 10s, shared by every stage so exports line up
+BUCKET_EDGES = np.logspace(-2, 4, 61)
+BUCKET_EDGE_LIST = BUCKET_EDGES.tolist() # bisect on a list is a lot cheaper than searchsorted per sample
+
+
+class NullTimer():
+    """Timer that records nothing, what everything uses unless instrumentation is on"""
+    enabled = False
+
+    def start(self):
+        return 0.0
+
+    def stop(self, stage, start):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class StageTimer():
+    """
+    Rolling per stage latencies: the last window samples of every stage (what percentiles are taken over)
+    plus a histogram of every sample since the start, for exports.
+    The pipeline records from several threads while the HUD reads stats, so all of it goes through a lock.
+    """
+    enabled = True
+
+    def __init__(self, window=300):
+        self.window = window
+        self.samples = {} # stage -> (window,) ms, used as a ring buffer
+        self.heads = {} # stage -> number of samples ever recorded
+        self.histograms = {} # stage -> counts per BUCKET_EDGES bucket, over the whole run
+        self.totals = {} # stage -> total ms over the whole run
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def start(self):
+        return time.perf_counter()
+
+    def stop(self, stage, start):
+        self.record(stage, (time.perf_counter() - start) * 1000)
+
+    def record(self, stage, ms):
+        with self.lock:
+            self._record(stage, ms)
+
+    def _record(self, stage, ms):
+        samples = self.samples.get(stage)
+        if samples is None:
+            samples = self.samples[stage] = np.zeros(self.window)
+            self.heads[stage] = 0
+            self.histograms[stage] = [0] * (len(BUCKET_EDGES) + 1)
+            self.totals[stage] = 0.0
+        head = self.heads[stage]
+        samples[head % self.window] = ms
+        self.heads[stage] = head + 1
+        self.histograms[stage][bisect.bisect_left(BUCKET_EDGE_LIST, ms)] += 1
+        self.totals[stage] += ms
+
+    def recent(self, stage):
+        """A copy of the samples of stage still in the window, oldest first not guaranteed"""
+        with self.lock:
+            return self.samples[stage][:min(self.heads[stage], self.window)].copy()
+
+    def stats(self):
+        """stage -> {count, mean_ms, p50_ms, p90_ms, p99_ms, max_ms} over the window, plus whole run count and total"""
+        # copy under the lock, percentiles outside it so recording threads don't wait on them
+        with self.lock:
+            snapshot = [(stage, samples[:min(self.heads[stage], self.window)].copy(), self.heads[stage], self.totals[stage])
+                        for stage, samples in self.samples.items()]
+        stats = {}
+        for stage, recent, count, total in snapshot:
+            p50, p90, p99 = np.percentile(recent, [50, 90, 99])
+            stats[stage] = {
+                'count': count,
+                'total_ms': total,
+                'mean_ms': float(recent.mean()),
+                'p50_ms': float(p50),
+                'p90_ms': float(p90),
+                'p99_ms': float(p99),
+                'max_ms': float(recent.max()),
+            }
+        return stats
+
+    def fps(self, stage='frame'):
+        """Frames per second going by the mean duration of stage over the window"""
+        with self.lock:
+            if stage not in self.samples:
+                return 0.0
+        mean = self.recent(stage).mean()
+        return 1000 / mean if mean > 0 else 0.0
+
+    def export(self, path):
+        """Writes stats() to path, as CSV if it ends in .csv, JSON (with the whole run histograms) otherwise"""
+        stats = self.stats()
+        with self.lock:
+            histograms = {stage: list(self.histograms[stage]) for stage in stats}
+        if path.endswith('.csv'):
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                columns = ['count', 'total_ms', 'mean_ms', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms']
+                writer.writerow(['stage'] + columns)
+                for stage, row in stats.items():
+                    writer.writerow([stage] + [row[column] for column in columns])
+            return
+        with open(path, 'w') as f:
+            json.dump({
+                'seconds': time.perf_counter() - self.started,
+                'window': self.window,
+                'bucket_edges_ms': BUCKET_EDGES.tolist(),
+                'stages': {stage: {**row, 'histogram': histograms[stage]} for stage, row in stats.items()},
+            }, f, indent=2)
+
+
+class HUD():
+    """
+    Draws FPS, p50/p99 of every stage and what's on the canvas in the corner of the frame.
+    The text is only recomputed every refresh seconds, percentiles over every stage aren't free.
+    """
+
+    def __init__(self, timer, refresh=0.5):
+        self.timer = timer
+        self.refresh = refresh
+        self.updated = 0.0
+        self.lines = []
+
+    def draw(self, frame, canvas):
+        now = time.perf_counter()
+        if now - self.updated > self.refresh:
+            self.updated = now
+            points = sum(line.size for line in canvas.lines.values())
+            self.lines = [
+                f"FPS {self.timer.fps():.1f}",
+                f"strokes {len(canvas.lines)}  points {points}  shapes {len(canvas.circles) + len(canvas.squares)}",
+            ] + [f"{stage:<14} p50 {row['p50_ms']:6.2f}  p99 {row['p99_ms']:6.2f} ms" for stage, row in self.timer.stats().items()]
+
+        # bottom right, out of the way of the buttons
+        top = frame.shape[0] - 18 * len(self.lines) - 10
+        left = max(frame.shape[1] - 340, 0)
+        for i, text in enumerate(self.lines):
+            origin = (left, top + 18 * (i + 1))
+            cv.putText(frame, text, origin, cv.FONT_HERSHEY_SIMPLEX, 0.45, (0, 0, 0), 3, cv.LINE_AA)
+            cv.putText(frame, text, origin, cv.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1, cv.LINE_AA)
@@ -1,3 +1,5 @@
+import math
+
 import numpy as np
 
 def xy_euclidean_dist(a1, a2): 
@@ -19,3 +21,69 @@ def cos_angle(u, v):
     if (u_mag == 0 or v_mag == 0):
         return 0
     return np.dot(u, v) / (vector_magnitude(u) * vector_magnitude(v))
+
+def segment_distances(points, start, end):
+    """
+    Distance from each (r, c) point to the segment start->end.
+
+    Args:
+        points: (N, 2) array (or a single point)
+        start, end: endpoints of the segment
+    Returns:
+        (N,) float array of distances
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    start = np.asarray(start, dtype=np.float64)
+    seg = np.asarray(end, dtype=np.float64) - start
+    rel = points - start
+    seg_len_sq = seg @ seg
+    if seg_len_sq == 0:
+        return np.sqrt(np.einsum('ij,ij->i', rel, rel))
+    # project onto the segment, clamped so we measure to the nearest endpoint past the ends
+    t = np.clip(rel @ seg / seg_len_sq, 0, 1)
+    diff = rel - t[:, None] * seg
+    return np.sqrt(np.einsum('ij,ij->i', diff, diff))
+
+def within_segment(points, start, end, tolerance):
+    """
+    Same as (segment_distances(points, start, end) <= tolerance).all(), in plain python.
+    For the handful of points push_point checks per sample, where numpy's per call overhead is most of the cost.
+    """
+    start_r, start_c = float(start[0]), float(start[1])
+    seg_r, seg_c = float(end[0]) - start_r, float(end[1]) - start_c
+    seg_len_sq = seg_r * seg_r + seg_c * seg_c
+    for r, c in points:
+        rel_r, rel_c = r - start_r, c - start_c
+        if seg_len_sq != 0:
+            t = min(max((rel_r * seg_r + rel_c * seg_c) / seg_len_sq, 0.0), 1.0)
+            rel_r, rel_c = rel_r - t * seg_r, rel_c - t * seg_c
+        if math.sqrt(rel_r * rel_r + rel_c * rel_c) > tolerance:
+            return False
+    return True
+
+def rdp_mask(points, tolerance):
+    """
+    Ramer-Douglas-Peucker simplification.
+
+    Returns a boolean mask over points marking the ones to keep, endpoints are always kept.
+    Written with an explicit stack so long strokes can't blow the recursion limit.
+    """
+    num_points = len(points)
+    keep = np.zeros(num_points, dtype=bool)
+    if num_points == 0:
+        return keep
+    keep[0] = keep[-1] = True
+
+    stack = [(0, num_points - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        dists = segment_distances(points[start + 1:end], points[start], points[end])
+        farthest = int(np.argmax(dists))
+        if dists[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep